@@ -1,35 +1,205 @@
 import google.generativeai as genai
 from config import Config
+from utils.json_stream import JSONSectionStream
+from utils.documents import collect_strings, replace_strings
 import json
 
 class DecisionAgent:
-    def __init__(self):
+    def __init__(self, cache=None, translation_memory=None, corpus=None):
         genai.configure(api_key=Config.GEMINI_API_KEY)
         self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.cache = cache
+        self.translation_memory = translation_memory
+        self.corpus = corpus
     
     def generate_recommendations(self, detection_result, weather_data, location, language='en'):
         """Generate comprehensive gardening recommendations using Gemini"""
+        crop = detection_result.get('crop', 'unknown')
+        disease = detection_result.get('disease', 'Unknown')
+        is_healthy = detection_result.get('is_healthy', False)
+        
+        cache_key, cached = self.cached_recommendations(detection_result, weather_data, location, language)
+        if cached is not None:
+            return cached
         
+        recommendations = self.corpus_recommendations(detection_result, weather_data, location, language)
+        if recommendations is None:
+            try:
+                recommendations = self.request_recommendations(
+                    self.build_prompt(detection_result, weather_data, location, language)
+                )
+            except Exception as e:
+                print(f"Error generating recommendations: {e}")
+                return self.get_fallback_recommendations(crop, disease, is_healthy, language)
+        
+        if cache_key is not None:
+            self.cache.set(cache_key, recommendations)
+        return recommendations
+    
+    def stream_recommendations(self, detection_result, weather_data, location, language='en'):
+        """Yield (section, value) pairs as soon as each top-level section is generated
+        
+        Uses Gemini's streaming API and parses the JSON incrementally, so the
+        summary is available long before the whole document. If generation
+        fails part-way, the missing sections come from the fallback.
+        """
         crop = detection_result.get('crop', 'unknown')
         disease = detection_result.get('disease', 'Unknown')
-        confidence = detection_result.get('confidence', 0) * 100
         is_healthy = detection_result.get('is_healthy', False)
         
-        prompt = f"""You are an expert gardening advisor helping home gardeners and urban farmers in India.
+        cache_key, cached = self.cached_recommendations(detection_result, weather_data, location, language)
+        if cached is None:
+            cached = self.corpus_recommendations(detection_result, weather_data, location, language)
+        if cached is not None:
+            yield from cached.items()
+            return
+        
+        prompt = self.build_prompt(detection_result, weather_data, location, language)
+        parser = JSONSectionStream()
+        recommendations = {}
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                for section, value in parser.feed(chunk.text):
+                    recommendations[section] = value
+                    yield section, value
+            if not parser.finished:
+                raise ValueError('Response ended before the JSON object was complete')
+        except Exception as e:
+            print(f"Error streaming recommendations: {e}")
+            fallback = self.get_fallback_recommendations(crop, disease, is_healthy, language)
+            for section, value in fallback.items():
+                if section not in recommendations:
+                    yield section, value
+            return
+        
+        if cache_key is not None:
+            self.cache.set(cache_key, recommendations)
+    
+    def request_recommendations(self, prompt):
+        """Ask Gemini for a recommendations document; raises on any failure"""
+        response = self.model.generate_content(prompt)
+        return self.parse_json_response(response.text)
+    
+    def corpus_recommendations(self, detection_result, weather_data, location, language):
+        """Pre-generated advice from the offline corpus, optionally with a weather delta"""
+        if self.corpus is None or Config.ADVISORY_CORPUS_MODE == 'off':
+            return None
+        baseline = self.corpus.get(detection_result.get('crop'), detection_result.get('disease'), language)
+        if baseline is None:
+            return None
+        if Config.ADVISORY_CORPUS_MODE == 'corpus+delta':
+            return self.apply_weather_delta(baseline, detection_result, weather_data, location, language)
+        return baseline
+    
+    def apply_weather_delta(self, baseline, detection_result, weather_data, location, language):
+        """Overlay short, weather-specific watering and local advice on a baseline document"""
+        response_language = 'English' if language == 'en' else Config.LANGUAGES.get(language, 'English')
+        prompt = f"""You are an expert gardening advisor in India. A home gardener's {detection_result.get('crop', 'plant')} plant has: {detection_result.get('disease', 'Unknown')}.
 
-DETECTION RESULTS:
-- Crop/Plant: {crop.title()}
-- Health Status: {"Healthy ✓" if is_healthy else f"Disease Detected: {disease}"}
-- Confidence: {confidence:.1f}%
+Current conditions in {location.get('city')}, {location.get('region')}: {weather_data.get('temperature')}°C, humidity {weather_data.get('humidity')}%, {weather_data.get('description')}, recent rainfall {weather_data.get('rain', 0)}mm.
 
-LOCATION & WEATHER:
+General watering advice already given:
+{json.dumps(baseline.get('watering', {}), ensure_ascii=False)}
+
+Adjust it for the current conditions. Response language: {response_language}.
+Provide ONLY this JSON:
+{{
+  "watering": {{"frequency": "...", "amount": "...", "timing": "...", "weather_note": "..."}},
+  "local_considerations": "1-2 sentences for {location.get('region')} region in this weather"
+}}"""
+        try:
+            delta = self.request_recommendations(prompt)
+        except Exception as e:
+            print(f"Error generating weather delta: {e}")
+            return baseline
+        
+        recommendations = dict(baseline)
+        for section in ('watering', 'local_considerations'):
+            if section in delta:
+                recommendations[section] = delta[section]
+        return recommendations
+    
+    def cached_recommendations(self, detection_result, weather_data, location, language):
+        """(cache key, cached recommendations or None); the key is None without a cache"""
+        if self.cache is None:
+            return None, None
+        # Advice only depends on the diagnosis, coarse weather, region and language
+        cache_key = self.recommendation_cache_key(detection_result, weather_data, location, language)
+        return cache_key, self.cache.get(cache_key)
+    
+    def recommendation_cache_key(self, detection_result, weather_data, location, language):
+        """Cache key from the diagnosis and bucketed weather/region
+        
+        Severity bands follow model confidence; temperature is bucketed in
+        5 degree steps, humidity in 20% steps and rain into none/light/
+        moderate/heavy, so nearby conditions share one answer.
+        """
+        confidence = detection_result.get('confidence', 0)
+        severity = 'high' if confidence >= 0.8 else 'medium' if confidence >= 0.5 else 'low'
+        
+        def bucket(value, step, default):
+            try:
+                return int(float(value) // step)
+            except (TypeError, ValueError):
+                return default
+        
+        rain = weather_data.get('rain') or 0
+        rain_band = 'none' if rain <= 0 else 'light' if rain < 2.5 else 'moderate' if rain < 10 else 'heavy'
+        
+        parts = [
+            detection_result.get('crop', 'unknown'),
+            detection_result.get('disease', 'Unknown'),
+            severity,
+            f"t{bucket(weather_data.get('temperature'), 5, 'na')}",
+            f"h{bucket(weather_data.get('humidity'), 20, 'na')}",
+            rain_band,
+            (location.get('region') or 'unknown').lower(),
+            language
+        ]
+        return '|'.join(str(part) for part in parts)
+    
+    def parse_json_response(self, text):
+        """Strip markdown fences from a model reply and parse the JSON"""
+        text = text.strip()
+        if text.startswith('```json'):
+            text = text[7:]
+        if text.endswith('```'):
+            text = text[:-3]
+        return json.loads(text.strip())
+    
+    def build_prompt(self, detection_result, weather_data, location, language='en'):
+        """Recommendation prompt for a detection and its local conditions"""
+        crop = detection_result.get('crop', 'unknown')
+        disease = detection_result.get('disease', 'Unknown')
+        confidence = detection_result.get('confidence', 0) * 100
+        is_healthy = detection_result.get('is_healthy', False)
+        
+        if weather_data is None:
+            # Baseline advice for the offline corpus: no particular place or day
+            location = {'region': 'India'}
+            conditions = """LOCATION & WEATHER:
+- Location: Anywhere in India
+- Weather: Not known; give advice for typical seasonal conditions and say how to adjust for heat, rain and humidity
+"""
+        else:
+            conditions = f"""LOCATION & WEATHER:
 - Location: {location.get('city')}, {location.get('region')}, {location.get('country')}
 - Temperature: {weather_data.get('temperature')}°C (Feels like {weather_data.get('feels_like')}°C)
 - Humidity: {weather_data.get('humidity')}%
 - Weather: {weather_data.get('description')}
 - Wind Speed: {weather_data.get('wind_speed')} m/s
 - Recent Rainfall: {weather_data.get('rain', 0)}mm
+"""
+        response_language = 'English' if language == 'en' else Config.LANGUAGES.get(language, 'English')
+        
+        return f"""You are an expert gardening advisor helping home gardeners and urban farmers in India.
 
+DETECTION RESULTS:
+- Crop/Plant: {crop.title()}
+- Health Status: {"Healthy ✓" if is_healthy else f"Disease Detected: {disease}"}
+- Confidence: {confidence:.1f}%
+
+{conditions}
 TARGET AUDIENCE: Home gardeners, balcony gardeners, urban farmers with limited space
 
 INSTRUCTIONS:
@@ -40,7 +210,7 @@ INSTRUCTIONS:
 5. Give step-by-step guidance that's easy to follow
 6. Recommend easily available materials from local garden stores
 7. Include prevention tips for future growing
-8. Response language: {"Hindi (हिंदी)" if language == 'hi' else "English"}
+8. Response language: {response_language}
 
 Please provide recommendations in the following JSON format:
 {{
@@ -104,26 +274,13 @@ Please provide recommendations in the following JSON format:
 }}
 
 Provide ONLY the JSON output, no additional text."""
-
-        try:
-            response = self.model.generate_content(prompt)
-            
-            # Extract JSON from response
-            text = response.text.strip()
-            if text.startswith('```json'):
-                text = text[7:]
-            if text.endswith('```'):
-                text = text[:-3]
-            text = text.strip()
-            
-            recommendations = json.loads(text)
-            return recommendations
-        except Exception as e:
-            print(f"Error generating recommendations: {e}")
-            return self.get_fallback_recommendations(crop, disease, is_healthy)
     
-    def get_fallback_recommendations(self, crop, disease, is_healthy):
+    def get_fallback_recommendations(self, crop, disease, is_healthy, language='en'):
         """Fallback recommendations if API fails"""
+        if self.corpus is not None:
+            baseline = self.corpus.get(crop, disease, language) or self.corpus.get(crop, disease, 'en')
+            if baseline is not None:
+                return baseline
         return {
             "summary": f"Your {crop} plant {'appears healthy' if is_healthy else f'may have {disease}'}. Keep monitoring and maintain good care practices.",
             "disease_info": {
@@ -154,11 +311,62 @@ Provide ONLY the JSON output, no additional text."""
             ]
         }
     
+    def translate_texts(self, texts, target_language):
+        """Translate a list of strings with one Gemini call per batch
+        
+        Duplicates are translated once. Strings of a batch that fails come
+        back untranslated, matching translate_text.
+        """
+        texts = list(texts)
+        if target_language == 'en' or not texts:
+            return texts
+        
+        unique = [text for text in dict.fromkeys(texts) if text.strip()]
+        translations = {}
+        if self.translation_memory is not None:
+            translations = self.translation_memory.lookup(unique, target_language)
+            unique = [text for text in unique if text not in translations]
+        batch_size = Config.TRANSLATION_BATCH_SIZE
+        for start in range(0, len(unique), batch_size):
+            batch = unique[start:start + batch_size]
+            prompt = f"""Translate each string in the following JSON array of gardening advice to {Config.LANGUAGES[target_language]}.
+Maintain technical terms where appropriate and keep the practical nature of the advice.
+
+Return ONLY a JSON array of exactly {len(batch)} translated strings, in the same order.
+
+{json.dumps(batch, ensure_ascii=False)}"""
+            
+            try:
+                response = self.model.generate_content(prompt)
+                translated = self.parse_json_response(response.text)
+                if not isinstance(translated, list) or len(translated) != len(batch):
+                    raise ValueError(f'expected {len(batch)} translations')
+                translated = dict(zip(batch, (str(item) for item in translated)))
+            except Exception as e:
+                print(f"Error translating batch: {e}")
+                continue
+            translations.update(translated)
+            if self.translation_memory is not None:
+                self.translation_memory.store(translated, target_language)
+        
+        return [translations.get(text, text) for text in texts]
+    
+    def translate_document(self, document, target_language):
+        """Translate every leaf string of a recommendations dict (or list), keeping its shape"""
+        strings = collect_strings(document)
+        translated = self.translate_texts(strings, target_language)
+        return replace_strings(document, iter(translated))
+    
     def translate_text(self, text, target_language):
         """Translate text to target language"""
         if target_language == 'en':
             return text
         
+        if self.translation_memory is not None:
+            remembered = self.translation_memory.get(text, target_language)
+            if remembered is not None:
+                return remembered
+        
         prompt = f"""Translate the following gardening advice to {Config.LANGUAGES[target_language]}. 
 Maintain technical terms where appropriate and keep the practical nature of the advice.
 
@@ -169,6 +377,10 @@ Provide only the translation, no additional text."""
         
         try:
             response = self.model.generate_content(prompt)
-            return response.text.strip()
+            translated = response.text.strip()
         except:
-            return text  # Return original if translation fails
\ No newline at end of file
+            return text  # Return original if translation fails
+        
+        if self.translation_memory is not None:
+            self.translation_memory.put(text, target_language, translated)
+        return translated
\ No newline at end of file
@@ -0,0 +1,121 @@
+import os
+import threading
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Quantized TFLite variants utils.model_quantize can publish
+QUANTIZED_VARIANTS = ('int8', 'float16')
+
+# File extension of the artifact each backend runs
+BACKEND_EXTENSIONS = {
+    'keras': '.h5',
+    'tflite': '.tflite',
+    'onnx': '.onnx'
+}
+
+
+def _tflite_interpreter_class():
+    """Prefer the standalone tflite-runtime wheel over full TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """Keras-style predict() over a TFLite interpreter
+
+    XNNPACK is the default CPU delegate for float models in current TFLite
+    builds. Integer-quantized inputs and outputs are (de)quantized here so
+    callers always see float32 probabilities.
+    """
+
+    def __init__(self, model_path, num_threads=None, output_names=None):
+        Interpreter = _tflite_interpreter_class()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.runner = self.interpreter.get_signature_runner()
+        details = self.runner.get_input_details()
+        self.input_name, self.input_details = next(iter(details.items()))
+        self.output_details = self.runner.get_output_details()
+        self.output_names = output_names or sorted(self.output_details)
+        self.nbytes = os.path.getsize(model_path)
+        self.lock = threading.Lock()
+
+    @property
+    def output_shape(self):
+        return tuple(self.output_details[self.output_names[0]]['shape'])
+
+    def _quantize(self, batch):
+        dtype = self.input_details['dtype']
+        scale, zero_point = self.input_details['quantization']
+        if dtype in (np.int8, np.uint8) and scale:
+            batch = np.round(batch / scale + zero_point)
+            info = np.iinfo(dtype)
+            return np.clip(batch, info.min, info.max).astype(dtype)
+        return batch.astype(dtype, copy=False)
+
+    def _dequantize(self, name, output):
+        scale, zero_point = self.output_details[name]['quantization']
+        if output.dtype in (np.int8, np.uint8) and scale:
+            return (output.astype(np.float32) - zero_point) * scale
+        return output
+
+    def predict(self, batch, verbose=0):
+        # The interpreter holds mutable tensors and is not thread-safe
+        with self.lock:
+            outputs = self.runner(**{self.input_name: self._quantize(batch)})
+        results = [self._dequantize(name, outputs[name]) for name in self.output_names]
+        return results[0] if len(results) == 1 else results
+
+
+class ONNXModel:
+    """Keras-style predict() over an ONNX Runtime CPU session"""
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.nbytes = os.path.getsize(model_path)
+
+    @property
+    def output_shape(self):
+        return tuple(self.session.get_outputs()[0].shape)
+
+    def predict(self, batch, verbose=0):
+        outputs = self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+def load_model(model_path, num_threads=None, output_names=None):
+    """Load a model artifact with the runtime matching its extension"""
+    extension = os.path.splitext(model_path)[1]
+    if extension == '.tflite':
+        return TFLiteModel(model_path, num_threads, output_names)
+    if extension == '.onnx':
+        return ONNXModel(model_path, num_threads)
+
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_path)
+
+
+def variant_path(base_path, variant):
+    """Path of a quantized TFLite variant, e.g. tomato_model.int8.tflite"""
+    return f'{os.path.splitext(base_path)[0]}.{variant}.tflite'
+
+
+def artifact_path(base_path, backend):
+    """Path of the backend's artifact for a model, falling back to the .h5"""
+    stem = os.path.splitext(base_path)[0]
+    candidate = stem + BACKEND_EXTENSIONS.get(backend, '.h5')
+    if os.path.exists(candidate):
+        return candidate
+    if backend != 'keras':
+        logger.warning(f"No {backend} artifact for {os.path.basename(stem)}, using Keras model")
+    return base_path
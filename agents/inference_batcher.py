@@ -0,0 +1,116 @@
+import threading
+import time
+import queue
+from collections import Counter
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingPrediction:
+    def __init__(self, model, inputs):
+        self.model = model
+        self.inputs = inputs
+        self.outputs = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceBatcher:
+    """Coalesce concurrent predict() calls for the same model into one batch
+
+    Each model key gets a worker thread. The worker takes the first waiting
+    request, keeps collecting requests for up to `window_ms` or until
+    `max_batch_size` rows are queued, runs a single predict on the stacked
+    tensor and hands every caller back its own rows.
+    """
+
+    def __init__(self, window_ms=5, max_batch_size=16):
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.batch_sizes = {}
+        self.requests = Counter()
+
+    def predict(self, key, model, inputs):
+        """Blocking predict that may share a batch with concurrent callers"""
+        pending = _PendingPrediction(model, inputs)
+        self._queue_for(key).put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.outputs
+
+    def _queue_for(self, key):
+        with self.lock:
+            if key not in self.queues:
+                self.queues[key] = queue.Queue()
+                self.batch_sizes[key] = Counter()
+                worker = threading.Thread(target=self._worker, args=(key,),
+                                          name=f'batcher-{key}', daemon=True)
+                worker.start()
+            return self.queues[key]
+
+    def _collect(self, pending_queue):
+        batch = [pending_queue.get()]
+        rows = len(batch[0].inputs)
+        deadline = time.monotonic() + self.window
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = pending_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item.inputs)
+        return batch, rows
+
+    def _worker(self, key):
+        pending_queue = self.queues[key]
+        while True:
+            batch, rows = self._collect(pending_queue)
+            # Callers pass the model so an evicted model is not kept alive here
+            model = batch[0].model
+            with self.lock:
+                self.batch_sizes[key][rows] += 1
+                self.requests[key] += len(batch)
+            try:
+                stacked = batch[0].inputs if len(batch) == 1 else np.concatenate(
+                    [item.inputs for item in batch], axis=0)
+                outputs = model.predict(stacked, verbose=0)
+                self._scatter(batch, outputs)
+            except Exception as e:
+                logger.error(f"Batched prediction for {key} failed: {str(e)}")
+                for item in batch:
+                    item.error = e
+            finally:
+                for item in batch:
+                    item.done.set()
+
+    def _scatter(self, batch, outputs):
+        """Slice each caller's rows back out of the batched outputs"""
+        offset = 0
+        for item in batch:
+            size = len(item.inputs)
+            if isinstance(outputs, (list, tuple)):
+                item.outputs = [output[offset:offset + size] for output in outputs]
+            else:
+                item.outputs = outputs[offset:offset + size]
+            offset += size
+
+    def stats(self):
+        """Queue depth and batch-size histogram per model"""
+        with self.lock:
+            return {
+                key: {
+                    'queue_depth': self.queues[key].qsize(),
+                    'requests': self.requests[key],
+                    'batches': sum(self.batch_sizes[key].values()),
+                    'batch_size_histogram': dict(sorted(self.batch_sizes[key].items()))
+                }
+                for key in self.queues
+            }
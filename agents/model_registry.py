@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def model_nbytes(model):
+    """Approximate resident size of a model from its weights"""
+    nbytes = getattr(model, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    try:
+        return int(sum(weight.nbytes for weight in model.get_weights()))
+    except Exception:
+        return 0
+
+
+class ModelRegistry:
+    """Models loaded on first use and kept in an LRU within a memory budget
+
+    Keys map to model files; several keys may share one file (the heads of a
+    multi-head model), which is then loaded and counted once. A budget of 0
+    means unlimited.
+    """
+
+    def __init__(self, loader, max_models=0, max_bytes=0):
+        self.loader = loader
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.paths = {}
+        self.resident = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def register(self, key, path):
+        """Make a model file available under a key without loading it"""
+        with self.lock:
+            self.paths[key] = path
+            self.load_locks.setdefault(path, threading.Lock())
+
+    def unregister(self, key):
+        with self.lock:
+            self.paths.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def keys(self):
+        return list(self.paths.keys())
+
+    def is_resident(self, key):
+        return self.paths.get(key) in self.resident
+
+    def get(self, key):
+        """Return the model for a key, loading it (once) if needed"""
+        path = self.paths[key]
+        with self.lock:
+            if path in self.resident:
+                self.resident.move_to_end(path)
+                return self.resident[path]['model']
+            load_lock = self.load_locks[path]
+
+        # Loading can take seconds; only callers for the same file wait
+        with load_lock:
+            with self.lock:
+                if path in self.resident:
+                    self.resident.move_to_end(path)
+                    return self.resident[path]['model']
+
+            started = time.perf_counter()
+            model = self.loader(path)
+            entry = {
+                'model': model,
+                'bytes': model_nbytes(model),
+                'load_seconds': round(time.perf_counter() - started, 3),
+                'loaded_at': time.time()
+            }
+            logger.info(f"Loaded model {path} in {entry['load_seconds']}s")
+
+            with self.lock:
+                self.resident[path] = entry
+                self.loads += 1
+                self._evict(keep=path)
+            return model
+
+    __getitem__ = get
+
+    def _evict(self, keep):
+        """Drop least recently used models until the budget is met"""
+        def over_budget():
+            if self.max_models and len(self.resident) > self.max_models:
+                return True
+            total = sum(entry['bytes'] for entry in self.resident.values())
+            return bool(self.max_bytes) and total > self.max_bytes
+
+        while len(self.resident) > 1 and over_budget():
+            oldest = next(iter(self.resident))
+            if oldest == keep:
+                break
+            self.resident.pop(oldest)
+            self.evictions += 1
+            logger.info(f"Evicted model {oldest}")
+
+    def warm_up(self, keys):
+        """Load the given keys ahead of the first request"""
+        for key in keys:
+            if key not in self.paths:
+                continue
+            try:
+                self.get(key)
+            except Exception as e:
+                logger.error(f"Warm-up of {key} failed: {str(e)}")
+
+    def stats(self):
+        """Which models are resident and how much memory each uses"""
+        with self.lock:
+            resident = {
+                key: {
+                    'bytes': self.resident[path]['bytes'],
+                    'load_seconds': self.resident[path]['load_seconds']
+                }
+                for key, path in self.paths.items() if path in self.resident
+            }
+            return {
+                'available': len(self.paths),
+                'resident': resident,
+                'resident_bytes': sum(entry['bytes'] for entry in self.resident.values()),
+                'max_models': self.max_models,
+                'max_bytes': self.max_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
@@ -1,49 +1,219 @@
-import tensorflow as tf
 import numpy as np
-from PIL import Image
 import os
+import json
+import hashlib
+import threading
 from config import Config
+from agents.inference_batcher import InferenceBatcher
+from agents.model_registry import ModelRegistry
+from agents import inference_backends
+from utils.image_pipeline import ImagePreprocessor
+from utils.upload_store import content_hash
+
+# Disease labels of each crop model, in output order
+CLASS_NAMES = {
+    'apple': ['Apple_scab', 'Black_rot', 'Cedar_apple_rust', 'Healthy'],
+    'cherry': ['Powdery_mildew', 'Healthy'],
+    'corn': ['Cercospora_leaf_spot', 'Common_rust', 'Northern_Leaf_Blight', 'Healthy'],
+    'grape': ['Black_rot', 'Esca', 'Leaf_blight', 'Healthy'],
+    'peach': ['Bacterial_spot', 'Healthy'],
+    'pepper': ['Bacterial_spot', 'Healthy'],
+    'potato': ['Early_blight', 'Late_blight', 'Healthy'],
+    'strawberry': ['Leaf_scorch', 'Healthy'],
+    'tomato': ['Bacterial_spot', 'Early_blight', 'Late_blight', 'Leaf_Mold', 
+               'Septoria_leaf_spot', 'Spider_mites', 'Target_Spot', 
+               'Tomato_Yellow_Leaf_Curl_Virus', 'Tomato_mosaic_virus', 'Healthy']
+}
 
 class VisionAgent:
-    def __init__(self):
-        self.models = {}
-        self.class_names = {
-            'apple': ['Apple_scab', 'Black_rot', 'Cedar_apple_rust', 'Healthy'],
-            'cherry': ['Powdery_mildew', 'Healthy'],
-            'corn': ['Cercospora_leaf_spot', 'Common_rust', 'Northern_Leaf_Blight', 'Healthy'],
-            'grape': ['Black_rot', 'Esca', 'Leaf_blight', 'Healthy'],
-            'peach': ['Bacterial_spot', 'Healthy'],
-            'pepper': ['Bacterial_spot', 'Healthy'],
-            'potato': ['Early_blight', 'Late_blight', 'Healthy'],
-            'strawberry': ['Leaf_scorch', 'Healthy'],
-            'tomato': ['Bacterial_spot', 'Early_blight', 'Late_blight', 'Leaf_Mold', 
-                       'Septoria_leaf_spot', 'Spider_mites', 'Target_Spot', 
-                       'Tomato_Yellow_Leaf_Curl_Virus', 'Tomato_mosaic_virus', 'Healthy']
-        }
+    ROUTER_KEY = 'crop_router'
+    
+    def __init__(self, result_cache=None):
+        self.result_cache = result_cache
+        self.models = ModelRegistry(
+            self.load_model,
+            max_models=Config.MODEL_CACHE_MAX_MODELS,
+            max_bytes=int(Config.MODEL_CACHE_MAX_MB * 1024 * 1024)
+        )
+        self.head_index = {}
+        self.preprocessor = ImagePreprocessor(Config.IMG_SIZE)
+        self.batcher = None
+        if Config.BATCH_WINDOW_MS > 0:
+            self.batcher = InferenceBatcher(Config.BATCH_WINDOW_MS, Config.MAX_BATCH_SIZE)
+        self.class_names = CLASS_NAMES
+        self.model_versions = {}
         self.load_models()
     
     def load_models(self):
-        """Load all crop models"""
+        """Register available crop models; they load on first use"""
+        if Config.VISION_MODE == 'multihead':
+            self.load_multihead_model()
+        
+        router_path = self.model_path(Config.CROP_ROUTER_MODEL_FILE)
+        if os.path.exists(router_path):
+            self.models.register(self.ROUTER_KEY, router_path)
+        
         for crop in Config.CROPS:
-            model_path = os.path.join(Config.MODEL_PATH, f'{crop}_model.h5')
+            if crop in self.models:
+                continue
+            variant = Config.MODEL_VARIANTS.get(crop)
+            if variant and variant not in inference_backends.QUANTIZED_VARIANTS:
+                print(f"Unknown model variant '{variant}' for {crop} in MODEL_VARIANTS, using default model")
+                variant = None
+            model_path = self.model_path(f'{crop}_model.h5', variant)
             if os.path.exists(model_path):
-                try:
-                    self.models[crop] = tf.keras.models.load_model(model_path)
-                    print(f"Loaded {crop} model successfully")
-                except Exception as e:
-                    print(f"Error loading {crop} model: {e}")
-    
-    def preprocess_image(self, image_path):
-        """Preprocess image for model input"""
-        img = Image.open(image_path).convert('RGB')
-        img = img.resize(Config.IMG_SIZE)
-        img_array = np.array(img) / 255.0  # Normalize to [0, 1]
-        img_array = np.expand_dims(img_array, axis=0)
-        return img_array
-    
-    def detect_disease(self, image_path, crop_type):
-        """Detect disease in crop image"""
-        if crop_type not in self.models:
+                self.models.register(crop, model_path)
+        
+        self.model_versions = self.artifact_versions()
+        
+        if Config.MODEL_WARMUP:
+            threading.Thread(target=self.models.warm_up, args=(Config.MODEL_WARMUP,),
+                             name='model-warmup', daemon=True).start()
+    
+    def model_path(self, filename, variant=None):
+        """Artifact to serve for a model file under the configured backend"""
+        base_path = os.path.join(Config.MODEL_PATH, filename)
+        if variant:
+            variant_path = inference_backends.variant_path(base_path, variant)
+            if os.path.exists(variant_path):
+                return variant_path
+            print(f"Quantized variant {variant_path} not published, using default model")
+        return inference_backends.artifact_path(base_path, Config.VISION_BACKEND)
+    
+    def load_model(self, model_path):
+        """Registry loader for a single model file"""
+        output_names = None
+        if self.head_index and model_path == self.model_path(Config.MULTIHEAD_MODEL_FILE):
+            output_names = [f'{crop}_head' for crop in self.head_index]
+        model = inference_backends.load_model(model_path, Config.INFERENCE_THREADS, output_names)
+        print(f"Loaded {os.path.basename(model_path)} successfully")
+        return model
+    
+    def load_multihead_model(self):
+        """Register one head per crop of the shared-backbone model"""
+        model_path = self.model_path(Config.MULTIHEAD_MODEL_FILE)
+        heads_path = os.path.splitext(model_path)[0] + '.json'
+        if not os.path.exists(model_path) or not os.path.exists(heads_path):
+            print(f"Multi-head model not found at {model_path}, using per-crop models")
+            return
+        
+        # The head order is written next to the model by utils.multihead_converter
+        with open(heads_path) as f:
+            heads = json.load(f)['heads']
+        for index, crop in enumerate(heads):
+            if crop in self.class_names:
+                self.head_index[crop] = index
+                self.models.register(crop, model_path)
+        print(f"Registered multi-head model with heads: {', '.join(self.head_index)}")
+    
+    def available_crops(self):
+        """Crops that have a disease model on disk"""
+        return [crop for crop in Config.CROPS if crop in self.models]
+    
+    def preprocess_image(self, image):
+        """Preprocess an image path, bytes or file object for model input"""
+        return self.preprocessor.load(image)
+    
+    def run_model(self, key, model, img_array):
+        """Run one model, sharing a batch with concurrent requests when enabled"""
+        if self.batcher is not None:
+            return self.batcher.predict(key, model, img_array)
+        return model.predict(img_array, verbose=0)
+    
+    def predict_crops(self, img_array, crops):
+        """Run the given crop models on a preprocessed image batch
+        
+        Crops served by the multi-head model share a single forward pass;
+        any remaining crops run their own model.
+        """
+        predictions = {}
+        shared = [crop for crop in crops if crop in self.head_index]
+        if shared:
+            model = self.models.get(shared[0])
+            outputs = self.run_model('multihead', model, img_array)
+            if not isinstance(outputs, (list, tuple)):
+                outputs = [outputs]
+            for crop in shared:
+                predictions[crop] = outputs[self.head_index[crop]][0]
+        
+        for crop in crops:
+            if crop not in predictions:
+                predictions[crop] = self.run_model(crop, self.models.get(crop), img_array)[0]
+        return predictions
+    
+    def format_prediction(self, crop_type, probabilities):
+        """Build the detection result dictionary for one crop's output"""
+        predicted_class = int(np.argmax(probabilities))
+        confidence = float(probabilities[predicted_class])
+        
+        disease = self.class_names[crop_type][predicted_class]
+        
+        # Get all predictions
+        all_preds = {
+            self.class_names[crop_type][i]: float(probabilities[i])
+            for i in range(len(probabilities))
+        }
+        
+        return {
+            'crop': crop_type,
+            'disease': disease,
+            'confidence': confidence,
+            'all_predictions': all_preds,
+            'is_healthy': 'Healthy' in disease
+        }
+    
+    def artifact_versions(self):
+        """Version token of every registered model: artifact path and modification time"""
+        versions = {}
+        for key in self.models.keys():
+            path = self.models.paths[key]
+            try:
+                versions[key] = f'{path}@{int(os.path.getmtime(path))}'
+            except OSError:
+                versions[key] = path
+        return versions
+    
+    def model_version(self, crop_type):
+        """Short hash of the models a result for crop_type depends on ('auto' uses all of them)"""
+        keys = sorted(self.model_versions) if crop_type == 'auto' else [crop_type]
+        parts = [Config.MODEL_VERSION, Config.VISION_MODE, str(Config.ROUTER_TOP_K)]
+        parts += [self.model_versions.get(key, '') for key in keys]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:12]
+    
+    def cache_key(self, image, crop_type, image_hash=None):
+        """Result cache key, or None if caching is off or the image is not in memory
+        
+        Includes the model version, so retrained, re-quantized or re-exported
+        models never serve results cached from their predecessors.
+        """
+        if self.result_cache is None:
+            return None
+        if image_hash is None and isinstance(image, (bytes, bytearray, memoryview)):
+            image_hash = content_hash(image)
+        return f'{image_hash}:{crop_type}:{self.model_version(crop_type)}' if image_hash else None
+    
+    def cached_detection(self, key, detect):
+        """Return a cached result for key, or run detect() and cache its result"""
+        if key is None:
+            return detect()
+        
+        result = self.result_cache.get(key)
+        if result is not None:
+            result['cached'] = True
+            return result
+        
+        result = detect()
+        if 'error' not in result:
+            self.result_cache.set(key, result)
+        return result
+    
+    def detect_disease(self, image, crop_type, image_hash=None):
+        """Detect disease in crop image (path, bytes or file object)"""
+        key = self.cache_key(image, crop_type, image_hash)
+        return self.cached_detection(key, lambda: self._detect_disease(image, crop_type))
+    
+    def _detect_disease(self, image, crop_type):
+        if crop_type not in self.class_names or crop_type not in self.models:
             return {
                 'error': f'Model not available for {crop_type}',
                 'crop': crop_type,
@@ -53,26 +223,9 @@ class VisionAgent:
             }
         
         try:
-            img_array = self.preprocess_image(image_path)
-            predictions = self.models[crop_type].predict(img_array, verbose=0)
-            predicted_class = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class])
-            
-            disease = self.class_names[crop_type][predicted_class]
-            
-            # Get all predictions
-            all_preds = {
-                self.class_names[crop_type][i]: float(predictions[0][i])
-                for i in range(len(predictions[0]))
-            }
-            
-            return {
-                'crop': crop_type,
-                'disease': disease,
-                'confidence': confidence,
-                'all_predictions': all_preds,
-                'is_healthy': 'Healthy' in disease
-            }
+            img_array = self.preprocess_image(image)
+            predictions = self.predict_crops(img_array, [crop_type])
+            return self.format_prediction(crop_type, predictions[crop_type])
         except Exception as e:
             return {
                 'error': str(e),
@@ -82,20 +235,73 @@ class VisionAgent:
                 'all_predictions': {}
             }
     
-    def auto_detect_crop(self, image_path):
-        """Try to detect which crop type from image (run all models)"""
+    def route_crops(self, img_array):
+        """Crop probabilities from the router, most likely first"""
+        if self.ROUTER_KEY not in self.models:
+            return {}
+        model = self.models.get(self.ROUTER_KEY)
+        if model.output_shape[-1] != len(Config.CROPS):
+            print(f"Crop router has {model.output_shape[-1]} outputs, expected {len(Config.CROPS)}; ignoring it")
+            self.models.unregister(self.ROUTER_KEY)
+            return {}
+        
+        probabilities = self.run_model(self.ROUTER_KEY, model, img_array)[0]
+        ranked = sorted(zip(Config.CROPS, probabilities), key=lambda item: item[1], reverse=True)
+        return {crop: float(probability) for crop, probability in ranked}
+    
+    def auto_detect_crop(self, image, image_hash=None):
+        """Detect the crop type, then its disease
+        
+        With a crop router, only the disease models of the top-k router
+        candidates run and the winner maximises P(crop) * P(disease | crop).
+        Without one, every disease model runs and the most confident wins.
+        """
+        key = self.cache_key(image, 'auto', image_hash)
+        return self.cached_detection(key, lambda: self._auto_detect_crop(image))
+    
+    def _auto_detect_crop(self, image):
         best_result = None
-        best_confidence = 0.0
+        best_score = 0.0
+        crop_probabilities = {}
+        
+        try:
+            # Preprocess once; in multi-head mode this is also a single forward pass
+            img_array = self.preprocess_image(image)
+            crop_probabilities = self.route_crops(img_array)
+            if crop_probabilities:
+                candidates = [crop for crop in crop_probabilities if crop in self.models]
+                candidates = candidates[:max(1, Config.ROUTER_TOP_K)]
+            else:
+                candidates = self.available_crops()
+            predictions = self.predict_crops(img_array, candidates)
+        except Exception as e:
+            print(f"Error in auto detection: {e}")
+            candidates, predictions = [], {}
         
-        for crop in self.models.keys():
-            result = self.detect_disease(image_path, crop)
-            if result.get('confidence', 0) > best_confidence:
-                best_confidence = result['confidence']
+        for crop, probabilities in predictions.items():
+            result = self.format_prediction(crop, probabilities)
+            score = result['confidence'] * crop_probabilities.get(crop, 1.0)
+            if score > best_score:
+                best_score = score
                 best_result = result
         
-        return best_result if best_result else {
-            'error': 'Could not detect crop type',
-            'crop': 'unknown',
-            'disease': 'Unknown',
-            'confidence': 0.0
-        }
\ No newline at end of file
+        if not best_result:
+            return {
+                'error': 'Could not detect crop type',
+                'crop': 'unknown',
+                'disease': 'Unknown',
+                'confidence': 0.0
+            }
+        
+        if crop_probabilities:
+            crop_stage = 'crop_router' if len(candidates) == 1 else 'crop_router+disease_models'
+        else:
+            crop_stage = 'disease_models'
+        best_result['routing'] = {
+            'crop_decided_by': crop_stage,
+            'disease_decided_by': f"{best_result['crop']}_disease_model",
+            'router_probabilities': crop_probabilities,
+            'candidates': candidates,
+            'models_run': len(predictions)
+        }
+        return best_result
@@ -1,40 +1,38 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
+from utils.http_client import shared_client
 import logging
 
 logger = logging.getLogger(__name__)
 
 class WeatherAgent:
-    def __init__(self):
+    # Current weather and forecast are fetched side by side
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather')
+    
+    def __init__(self, http=None):
         self.api_key = Config.WEATHER_API_KEY
         self.base_url = "http://api.openweathermap.org/data/2.5"
+        self.http = http or shared_client()
+    
+    def fetch(self, endpoint, lat, lon):
+        params = {
+            'lat': lat,
+            'lon': lon,
+            'appid': self.api_key,
+            'units': 'metric'
+        }
+        return self.http.get(f"{self.base_url}/{endpoint}", params=params).json()
     
     def get_weather_forecast(self, lat, lon):
         """
         Get 5-day weather forecast for gardening decisions
         """
         try:
-            # Current weather
-            current_url = f"{self.base_url}/weather"
-            current_params = {
-                'lat': lat,
-                'lon': lon,
-                'appid': self.api_key,
-                'units': 'metric'
-            }
-            current_response = requests.get(current_url, params=current_params)
-            current_data = current_response.json()
-            
-            # 5-day forecast
-            forecast_url = f"{self.base_url}/forecast"
-            forecast_params = {
-                'lat': lat,
-                'lon': lon,
-                'appid': self.api_key,
-                'units': 'metric'
-            }
-            forecast_response = requests.get(forecast_url, params=forecast_params)
-            forecast_data = forecast_response.json()
+            # Current weather and 5-day forecast, requested concurrently
+            current_future = self.executor.submit(self.fetch, 'weather', lat, lon)
+            forecast_future = self.executor.submit(self.fetch, 'forecast', lat, lon)
+            current_data = current_future.result()
+            forecast_data = forecast_future.result()
             
             return self._format_weather_data(current_data, forecast_data)
             
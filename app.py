@@ -1,8 +1,14 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, stream_with_context, render_template, request, jsonify, session, redirect, url_for
 import os
+import io
+import csv
+import json
+import time
 from werkzeug.utils import secure_filename
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from bson.objectid import ObjectId
 
 from config import Config
 from database import Database
@@ -11,6 +17,13 @@ from agents.decision_agent import DecisionAgent
 from agents.garden_agent import GardenKnowledgeAgent
 from agents.weather_agent import WeatherAgent
 from utils.location import LocationAgent 
+from utils.upload_store import UploadStore, content_hash
+from utils.cache import LRUCache, MongoCache, TieredCache
+from utils import phash as perceptual_hash
+from utils.pipeline import StagePipeline
+from utils.jobs import JobRegistry
+from utils.translation_memory import TranslationMemory
+from utils.advisory_corpus import AdvisoryCorpus
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -18,9 +31,41 @@ Config.init_app(app)
 
 # Initialize agents
 db = Database()
-vision_agent = VisionAgent()
-location_agent = LocationAgent()
-decision_agent = DecisionAgent()
+if Config.MONGO_INDEX_CHECK:
+    db.check_indexes()
+result_cache = None
+if Config.RESULT_CACHE_SIZE > 0:
+    result_cache = TieredCache(
+        LRUCache(Config.RESULT_CACHE_SIZE, Config.RESULT_CACHE_TTL),
+        MongoCache(db.detection_cache, Config.RESULT_CACHE_TTL) if Config.RESULT_CACHE_MONGO else None
+    )
+vision_agent = VisionAgent(result_cache)
+weather_cache = None
+if Config.WEATHER_CACHE_SIZE > 0:
+    weather_cache = TieredCache(
+        LRUCache(Config.WEATHER_CACHE_SIZE, Config.WEATHER_CACHE_TTL),
+        MongoCache(db.weather_cache, Config.WEATHER_CACHE_TTL) if Config.WEATHER_CACHE_MONGO else None
+    )
+location_agent = LocationAgent(weather_cache)
+recommendation_cache = None
+if Config.RECOMMENDATION_CACHE_SIZE > 0:
+    recommendation_cache = TieredCache(
+        LRUCache(Config.RECOMMENDATION_CACHE_SIZE, Config.RECOMMENDATION_CACHE_TTL),
+        MongoCache(db.recommendation_cache, Config.RECOMMENDATION_CACHE_TTL)
+        if Config.RECOMMENDATION_CACHE_MONGO else None
+    )
+translation_memory = TranslationMemory(db.translation_memory)
+advisory_corpus = AdvisoryCorpus()
+decision_agent = DecisionAgent(recommendation_cache, translation_memory, advisory_corpus)
+upload_store = UploadStore(Config.UPLOAD_FOLDER)
+# Pool for the short I/O-bound stages of /analyze (location, weather)
+executor = ThreadPoolExecutor(max_workers=Config.ANALYZE_WORKERS, thread_name_prefix='analyze')
+# Gemini calls take seconds (and keep their thread after a missed deadline)
+gemini_executor = ThreadPoolExecutor(max_workers=Config.ANALYZE_GEMINI_WORKERS, thread_name_prefix='gemini')
+# Phase-2 recommendation jobs get their own pool so they cannot starve /analyze
+recommendation_jobs = JobRegistry(
+    ThreadPoolExecutor(max_workers=Config.RECOMMENDATION_WORKERS, thread_name_prefix='recommendations')
+)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
@@ -32,6 +77,39 @@ def index():
         session['user_id'] = str(uuid.uuid4())
     return render_template('index.html', languages=Config.LANGUAGES, crops=Config.CROPS)
 
+def find_reusable_diagnosis(user_id, image_phash, crop_type, language):
+    """Earlier detection (with recommendations) of a near-identical image by this user"""
+    filters = {'language': language}
+    if crop_type != 'auto':
+        filters['crop_type'] = crop_type
+    since = datetime.utcnow() - timedelta(hours=Config.NEAR_DUPLICATE_WINDOW_HOURS)
+    previous = db.find_similar_detection(
+        user_id, image_phash, Config.NEAR_DUPLICATE_MAX_DISTANCE, since, **filters
+    )
+    if not previous:
+        return None
+    
+    recommendations = previous.get('recommendation') or db.get_recommendations(previous['_id'])
+    if not recommendations:
+        return None
+    
+    return {
+        'detection_id': str(previous['_id']),
+        'detection': {
+            'crop': previous['crop_type'],
+            'disease': previous['disease'],
+            'confidence': previous['confidence'],
+            'is_healthy': 'Healthy' in previous['disease'],
+            'reused': True,
+            'reused_from': previous['timestamp'].isoformat()
+        },
+        'location': previous['location'],
+        'weather': recommendations['weather_data'],
+        'recommendations': recommendations['recommendations'],
+        'reused': True,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """Analyze uploaded plant image"""
@@ -49,44 +127,120 @@ def analyze():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Use JPG, JPEG, or PNG'}), 400
         
-        # Save uploaded file
-        filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
-        filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        if Config.ANALYZE_IN_MEMORY:
+            # Decode straight from the upload; persisting happens in the background
+            image = file.read()
+            image_hash = content_hash(image)
+            filepath = None
+            if Config.PERSIST_UPLOADS:
+                filepath = upload_store.save(image, secure_filename(file.filename), image_hash)
+        else:
+            # Save uploaded file
+            filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
+            filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
+            file.save(filepath)
+            image = filepath
+            image_hash = None
         
-        # Get location
+        pipeline = StagePipeline(executor)
+        
+        # Reuse the diagnosis of a near-identical photo this user sent recently
+        image_phash = None
+        if Config.NEAR_DUPLICATE_LOOKUP:
+            try:
+                image_phash = pipeline.run('phash', perceptual_hash.dhash, image)
+            except Exception as e:
+                print(f"Error hashing image: {e}")
+        user_id = session.get('user_id')
+        if image_phash is not None and user_id:
+            reused = pipeline.run('dedup_lookup', find_reusable_diagnosis,
+                                  user_id, image_phash, crop_type, language)
+            if reused:
+                reused['timings'] = pipeline.report()
+                return jsonify(reused)
+        
+        # Location -> weather runs in the background while the image is analysed
         user_ip = request.remote_addr
-        location = location_agent.get_location_from_ip(user_ip)
+        location_future = pipeline.submit('location', location_agent.get_location_from_ip, user_ip)
+        
+        def wait_for_location():
+            return pipeline.wait('location', location_future, Config.LOCATION_TIMEOUT,
+                                 location_agent.get_default_location)
         
-        # Get weather
-        weather = location_agent.get_weather(location['lat'], location['lon'])
+        def fetch_weather(location):
+            return location, location_agent.get_weather(location['lat'], location['lon'])
+        
+        # Weather starts when the location arrives; no thread blocks in between
+        context_future = pipeline.then('weather', location_future, fetch_weather)
         
         # Detect disease
         if crop_type == 'auto':
-            detection = vision_agent.auto_detect_crop(filepath)
+            detection = pipeline.run('vision', vision_agent.auto_detect_crop, image, image_hash)
         else:
-            detection = vision_agent.detect_disease(filepath, crop_type)
+            detection = pipeline.run('vision', vision_agent.detect_disease, image, crop_type, image_hash)
         
         if 'error' in detection and detection['confidence'] == 0:
             return jsonify({'error': detection['error']}), 400
         
+        def save_detection():
+            return pipeline.run(
+                'save_detection', db.save_detection,
+                session['user_id'],
+                filepath,
+                detection['crop'],
+                detection['disease'],
+                detection['confidence'],
+                location,
+                language,
+                image_phash
+            )
+        
+        two_phase = request.form.get('two_phase', str(Config.ANALYZE_TWO_PHASE)).lower() in ('1', 'true', 'yes')
+        if two_phase:
+            # Phase 1: answer with the diagnosis now, generate advice in the background.
+            # Only the location (stored with the detection) is waited for; weather
+            # is resolved by the job and sent as a 'weather' event
+            location = wait_for_location()
+            detection_id = save_detection()
+            recommendation_jobs.submit(
+                str(detection_id), recommendation_job,
+                detection_id, detection, location, language, context_future
+            )
+            return jsonify({
+                'detection_id': str(detection_id),
+                'detection': detection,
+                'location': location,
+                'weather': None,
+                'recommendations': None,
+                'recommendations_status': 'pending',
+                'recommendations_url': url_for('recommendation_status', detection_id=str(detection_id)),
+                'recommendations_events_url': url_for('recommendation_events', detection_id=str(detection_id)),
+                'timings': pipeline.report(),
+                'timestamp': datetime.utcnow().isoformat()
+            })
+        
+        location, weather = pipeline.wait(
+            'weather', context_future, Config.LOCATION_TIMEOUT + Config.WEATHER_TIMEOUT,
+            lambda: (wait_for_location(), location_agent.get_default_weather())
+        )
+        
         # Generate recommendations
-        recommendations = decision_agent.generate_recommendations(
-            detection, weather, location, language
+        recommendations_future = pipeline.submit(
+            'recommendations', decision_agent.generate_recommendations,
+            detection, weather, location, language, executor=gemini_executor
+        )
+        recommendations = pipeline.wait(
+            'recommendations', recommendations_future,
+            pipeline.elapsed() + Config.RECOMMENDATION_TIMEOUT,
+            lambda: decision_agent.get_fallback_recommendations(
+                detection['crop'], detection['disease'], detection.get('is_healthy', False), language
+            )
         )
         
         # Save to database
-        detection_id = db.save_detection(
-            session['user_id'],
-            filepath,
-            detection['crop'],
-            detection['disease'],
-            detection['confidence'],
-            location,
-            language
-        )
+        detection_id = save_detection()
         
-        db.save_recommendation(detection_id, recommendations, weather)
+        pipeline.run('save_recommendation', db.save_recommendation, detection_id, recommendations, weather)
         
         return jsonify({
             'detection_id': str(detection_id),
@@ -94,6 +248,7 @@ def analyze():
             'location': location,
             'weather': weather,
             'recommendations': recommendations,
+            'timings': pipeline.report(),
             'timestamp': datetime.utcnow().isoformat()
         })
     
@@ -101,6 +256,128 @@ def analyze():
         print(f"Error in analyze: {e}")
         return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
+def recommendation_job(job, detection_id, detection, location, language, context_future):
+    """Phase 2 of /analyze: resolve the weather, generate recommendations and store them"""
+    try:
+        weather = context_future.result(timeout=Config.WEATHER_TIMEOUT)[1]
+    except Exception as e:
+        print(f"Weather unavailable for {detection_id}, using defaults: {e}")
+        weather = location_agent.get_default_weather()
+    recommendation_jobs.publish(job, 'weather', weather)
+    
+    if Config.STREAM_RECOMMENDATIONS:
+        # Push every section to subscribers as soon as it is complete
+        recommendations = {}
+        for section, value in decision_agent.stream_recommendations(detection, weather, location, language):
+            recommendations[section] = value
+            recommendation_jobs.publish(job, 'section', {'section': section, 'value': value})
+    else:
+        recommendations = decision_agent.generate_recommendations(detection, weather, location, language)
+    db.save_recommendation(detection_id, recommendations, weather)
+    return recommendations
+
+def saved_recommendations(detection_id):
+    """Stored recommendations of a detection, or None"""
+    if not ObjectId.is_valid(detection_id):
+        return None
+    return db.get_recommendations(ObjectId(detection_id))
+
+EXPORT_FIELDS = {
+    'timestamp': 1, 'crop_type': 1, 'disease': 1, 'confidence': 1, 'status': 1,
+    'language': 1, 'location.city': 1, 'location.region': 1, 'location.country': 1,
+    'location.lat': 1, 'location.lon': 1
+}
+CSV_COLUMNS = ['id', 'timestamp', 'crop_type', 'disease', 'confidence', 'status', 'language',
+               'city', 'region', 'country', 'lat', 'lon']
+
+def ndjson_rows(cursor):
+    buffer = []
+    for doc in cursor:
+        doc['id'] = str(doc.pop('_id'))
+        doc['timestamp'] = doc['timestamp'].isoformat()
+        buffer.append(json.dumps(doc, default=str) + '\n')
+        if len(buffer) >= Config.EXPORT_BATCH_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    yield ''.join(buffer)
+
+def csv_rows(cursor):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_COLUMNS)
+    for count, doc in enumerate(cursor, 1):
+        location = doc.get('location') or {}
+        writer.writerow([
+            doc['_id'], doc['timestamp'].isoformat(), doc.get('crop_type'), doc.get('disease'),
+            doc.get('confidence'), doc.get('status'), doc.get('language'),
+            location.get('city'), location.get('region'), location.get('country'),
+            location.get('lat'), location.get('lon')
+        ])
+        if count % Config.EXPORT_BATCH_SIZE == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_rows),
+    'csv': ('text/csv', csv_rows)
+}
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.route('/recommendations/<detection_id>')
+def recommendation_status(detection_id):
+    """Status and (when ready) result of a background recommendation job"""
+    job = recommendation_jobs.get(detection_id)
+    if job is not None:
+        return jsonify({
+            'detection_id': detection_id,
+            'status': job.status,
+            'recommendations': job.result,
+            'error': job.error
+        })
+    
+    # Finished long ago or generated by another worker
+    saved = saved_recommendations(detection_id)
+    if saved:
+        return jsonify({
+            'detection_id': detection_id,
+            'status': 'done',
+            'recommendations': saved['recommendations'],
+            'error': None
+        })
+    if ObjectId.is_valid(detection_id) and db.get_detection_by_id(detection_id):
+        return jsonify({'detection_id': detection_id, 'status': 'pending', 'recommendations': None, 'error': None})
+    return jsonify({'error': 'Detection not found'}), 404
+
+@app.route('/recommendations/<detection_id>/events')
+def recommendation_events(detection_id):
+    """Server-Sent Events stream of a recommendation job"""
+    job = recommendation_jobs.get(detection_id)
+    
+    def stream():
+        if job is not None:
+            for event, data in recommendation_jobs.subscribe(job, Config.RECOMMENDATION_TIMEOUT):
+                yield sse_message(event, data)
+            return
+        
+        # Not running in this worker: wait for another worker to store the result
+        deadline = time.monotonic() + Config.RECOMMENDATION_TIMEOUT
+        while time.monotonic() < deadline:
+            saved = saved_recommendations(detection_id)
+            if saved:
+                yield sse_message('recommendations', saved['recommendations'])
+                yield sse_message('status', {'status': 'done'})
+                return
+            yield ': waiting\n\n'
+            time.sleep(1)
+        yield sse_message('status', {'status': 'unknown'})
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/history')
 def history():
     """User's analysis history"""
@@ -108,28 +385,88 @@ def history():
     if not user_id:
         return redirect(url_for('index'))
     
-    history = db.get_user_history(user_id)
+    try:
+        history, next_cursor = db.get_user_history_page(
+            user_id, max(1, min(request.args.get('limit', 20, type=int), 100)), request.args.get('cursor')
+        )
+    except ValueError:
+        return redirect(url_for('history'))
     stats = db.get_statistics(user_id)
     
-    return render_template('history.html', history=history, stats=stats)
+    return render_template('history.html', history=history, stats=stats, next_cursor=next_cursor)
+
+@app.route('/history/export')
+def export_history():
+    """Stream the user's full history as NDJSON (default) or CSV"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('index'))
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+    mimetype, rows = EXPORT_FORMATS[export_format]
+    cursor = db.iter_user_detections(user_id, EXPORT_FIELDS, Config.EXPORT_BATCH_SIZE)
+    filename = f"detections-{datetime.utcnow():%Y%m%d}.{export_format}"
+    return Response(stream_with_context(rows(cursor)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @app.route('/detection/<detection_id>')
 def view_detection(detection_id):
     """View specific detection details"""
-    detection = db.get_detection_by_id(detection_id)
+    detection = db.get_detection_with_recommendations(detection_id)
     if not detection:
         return "Detection not found", 404
     
-    recommendations = db.get_recommendations(detection_id)
+    recommendations = detection.pop('recommendation', None)
     return render_template('detection.html', detection=detection, recommendations=recommendations)
 
+@app.route('/outbreaks/nearby')
+def outbreaks_nearby():
+    """Top diseases and active outbreak alerts near a coordinate"""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify({'error': 'lat and lon are required'}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'error': 'lat must be in [-90, 90] and lon in [-180, 180]'}), 400
+    radius_km = request.args.get('radius_km', 25, type=float)
+    days = request.args.get('days', 7, type=int)
+    if not radius_km > 0 or days < 1:
+        return jsonify({'error': 'radius_km must be positive and days at least 1'}), 400
+    radius_km = min(radius_km, 500)
+    days = min(days, 90)
+    
+    return jsonify({
+        'lat': lat,
+        'lon': lon,
+        'radius_km': radius_km,
+        'days': days,
+        'top_diseases': db.outbreaks.top_diseases_near(lat, lon, radius_km, days),
+        'alerts': db.outbreaks.alerts_near(lat, lon, radius_km)
+    })
+
 @app.route('/translate', methods=['POST'])
 def translate():
-    """Translate text to selected language"""
+    """Translate text to selected language
+    
+    Accepts a single 'text', a list of strings as 'texts', or a whole
+    recommendations 'document'; lists and documents are translated in
+    batched calls and returned in the same shape.
+    """
     data = request.get_json()
-    text = data.get('text')
     language = data.get('language', 'en')
     
+    if 'document' in data or 'texts' in data:
+        payload = data.get('document', data.get('texts'))
+        if language == 'en':
+            return jsonify({'translated': payload})
+        if language not in Config.LANGUAGES:
+            return jsonify({'error': f'Unsupported language: {language}'}), 400
+        return jsonify({'translated': decision_agent.translate_document(payload, language)})
+    
+    text = data.get('text')
+    
     if language == 'en':
         return jsonify({'translated': text})
     
@@ -139,12 +476,33 @@ def translate():
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({
+    status = {
         'status': 'healthy',
-        'models_loaded': len(vision_agent.models),
+        'models_loaded': len(vision_agent.models.resident),
+        'models': vision_agent.models.stats(),
         'supported_crops': Config.CROPS,
         'supported_languages': list(Config.LANGUAGES.keys())
-    })
+    }
+    if Config.ANALYZE_IN_MEMORY and Config.PERSIST_UPLOADS:
+        status['upload_store'] = upload_store.stats()
+    if result_cache is not None:
+        status['result_cache'] = result_cache.stats()
+    if recommendation_cache is not None:
+        status['recommendation_cache'] = recommendation_cache.stats()
+    status['recommendation_jobs'] = recommendation_jobs.stats()
+    status['translation_memory'] = translation_memory.stats()
+    status['geoip'] = location_agent.stats()
+    status['outbreaks'] = db.outbreaks.stats()
+    status['weather'] = location_agent.weather_stats()
+    status['http'] = location_agent.http.stats()
+    status['advisory_corpus'] = {
+        'version': advisory_corpus.version,
+        'entries': len(advisory_corpus),
+        'mode': Config.ADVISORY_CORPUS_MODE
+    }
+    if vision_agent.batcher is not None:
+        status['inference_batching'] = vision_agent.batcher.stats()
+    return jsonify(status)
 
 @app.route('/about')
 def about():
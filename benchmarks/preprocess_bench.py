@@ -0,0 +1,85 @@
+"""Microbenchmark: legacy VisionAgent.preprocess_image vs ImagePreprocessor.
+
+Synthesises phone-camera-sized JPEGs and times, per size:
+  legacy      PIL open from disk, default resize, float64 /255, expand_dims
+  pipeline    ImagePreprocessor from the same file (draft + reduce + float32)
+  from bytes  ImagePreprocessor from the in-memory upload bytes
+
+Usage:
+    python -m benchmarks.preprocess_bench [--runs 20]
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from config import Config
+from utils.image_pipeline import ImagePreprocessor
+
+PHONE_SIZES = [(1600, 1200), (3264, 2448), (4032, 3024), (4000, 3000)]
+
+
+def legacy_preprocess(image_path):
+    """The original VisionAgent.preprocess_image"""
+    img = Image.open(image_path).convert('RGB')
+    img = img.resize(Config.IMG_SIZE)
+    img_array = np.array(img) / 255.0
+    img_array = np.expand_dims(img_array, axis=0)
+    return img_array
+
+
+def synthetic_jpeg(size):
+    """A noisy gradient JPEG, so the encoder cannot cheat on flat colour"""
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    noise = np.random.randint(0, 40, (height, width), dtype=np.uint8)
+    pixels = np.stack([
+        (x + noise) % 256,
+        (y + noise) % 256,
+        ((x + y) / 2 + noise) % 256
+    ], axis=-1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def time_ms(func, runs):
+    func()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    preprocessor = ImagePreprocessor(Config.IMG_SIZE)
+    print(f"{'size':>11} {'jpeg KB':>8} {'legacy':>9} {'pipeline':>9} {'from bytes':>11} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in PHONE_SIZES:
+            data = synthetic_jpeg(size)
+            path = os.path.join(folder, f'{size[0]}x{size[1]}.jpg')
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            legacy = time_ms(lambda: legacy_preprocess(path), args.runs)
+            pipeline = time_ms(lambda: preprocessor.load(path), args.runs)
+            in_memory = time_ms(lambda: preprocessor.load(data), args.runs)
+            drift = float(np.max(np.abs(legacy_preprocess(path) - preprocessor.load(data))))
+
+            print(f"{size[0]:>5}x{size[1]:<5} {len(data) // 1024:>8} {legacy:>7.1f}ms {pipeline:>7.1f}ms "
+                  f"{in_memory:>9.1f}ms {legacy / in_memory:>7.1f}x  (max pixel drift {drift:.3f})")
+
+
+if __name__ == '__main__':
+    main()
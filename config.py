@@ -11,6 +11,24 @@ class Config:
     # MongoDB Configuration
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
     DATABASE_NAME = os.getenv('DATABASE_NAME', 'garden_advisor')
+    # Refuse to start if a hot query would scan a whole collection (explain())
+    MONGO_INDEX_CHECK = os.getenv('MONGO_INDEX_CHECK', 'false').lower() == 'true'
+    # Also store each detection's recommendations inside the detection document
+    # (migrate existing data with `python -m utils.migrate_recommendations --embed`)
+    EMBED_RECOMMENDATIONS = os.getenv('EMBED_RECOMMENDATIONS', 'false').lower() == 'true'
+    # Rows fetched per cursor batch (and flushed per chunk) by /history/export
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))
+    
+    # Outbreak analytics: detections counted per geohash cell (precision 5 is
+    # about 5 x 5 km), day, crop and disease. A cell is flagged when its last
+    # OUTBREAK_WINDOW_DAYS days exceed the previous OUTBREAK_BASELINE_WINDOWS
+    # windows by OUTBREAK_Z_THRESHOLD standard deviations (min OUTBREAK_MIN_COUNT)
+    OUTBREAK_TRACKING = os.getenv('OUTBREAK_TRACKING', 'true').lower() == 'true'
+    OUTBREAK_GEOHASH_PRECISION = int(os.getenv('OUTBREAK_GEOHASH_PRECISION', 5))
+    OUTBREAK_WINDOW_DAYS = int(os.getenv('OUTBREAK_WINDOW_DAYS', 7))
+    OUTBREAK_BASELINE_WINDOWS = int(os.getenv('OUTBREAK_BASELINE_WINDOWS', 4))
+    OUTBREAK_Z_THRESHOLD = float(os.getenv('OUTBREAK_Z_THRESHOLD', 3.0))
+    OUTBREAK_MIN_COUNT = int(os.getenv('OUTBREAK_MIN_COUNT', 5))
     
     # API Keys
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -19,11 +37,127 @@ class Config:
     # Upload Configuration
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    # Decode uploads in memory instead of writing them to disk and re-reading
+    # them; originals are then persisted (if enabled) by a background writer
+    ANALYZE_IN_MEMORY = os.getenv('ANALYZE_IN_MEMORY', 'true').lower() == 'true'
+    PERSIST_UPLOADS = os.getenv('PERSIST_UPLOADS', 'true').lower() == 'true'
     
     # Model Configuration
     MODEL_PATH = 'models'
     CROPS = ['apple', 'cherry', 'corn', 'grape', 'peach', 'pepper', 'potato', 'strawberry', 'tomato']
     
+    # 'per_crop' loads one {crop}_model.h5 per crop, 'multihead' loads a single
+    # shared backbone with one classification head per crop
+    VISION_MODE = os.getenv('VISION_MODE', 'per_crop')
+    MULTIHEAD_MODEL_FILE = 'multihead_model.h5'
+    
+    # First-stage crop classifier for auto-detect; its labels are CROPS in order.
+    # Only the disease models of the ROUTER_TOP_K most likely crops are run.
+    CROP_ROUTER_MODEL_FILE = 'crop_router_model.h5'
+    ROUTER_TOP_K = int(os.getenv('ROUTER_TOP_K', 2))
+    
+    # Micro-batching: concurrent predictions for the same model wait up to
+    # BATCH_WINDOW_MS to share one predict call (0 disables batching)
+    BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', 0))
+    MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 16))
+    
+    # Models load on first request and are evicted least-recently-used once
+    # either budget is exceeded (0 = unlimited). MODEL_WARMUP lists crops to
+    # load in the background at startup, e.g. "tomato,potato".
+    MODEL_CACHE_MAX_MODELS = int(os.getenv('MODEL_CACHE_MAX_MODELS', 0))
+    MODEL_CACHE_MAX_MB = float(os.getenv('MODEL_CACHE_MAX_MB', 0))
+    MODEL_WARMUP = [crop.strip() for crop in os.getenv('MODEL_WARMUP', '').split(',') if crop.strip()]
+    
+    # Inference runtime: 'keras' runs the .h5 files, 'tflite' and 'onnx' run the
+    # artifacts written by `python -m utils.model_export` (falling back to .h5)
+    VISION_BACKEND = os.getenv('VISION_BACKEND', 'keras')
+    INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0)) or None
+    
+    # Quantized variants per crop, e.g. "tomato:int8,potato:float16". A crop
+    # listed here serves models/{crop}_model.{variant}.tflite, which
+    # `python -m utils.model_quantize` only publishes if its top-1 agreement
+    # with the float model reaches QUANTIZATION_MIN_AGREEMENT
+    MODEL_VARIANTS = {
+        crop.strip(): variant.strip()
+        for crop, _, variant in (item.partition(':') for item in os.getenv('MODEL_VARIANTS', '').split(','))
+        if crop.strip() and variant.strip()
+    }
+    QUANTIZATION_MIN_AGREEMENT = float(os.getenv('QUANTIZATION_MIN_AGREEMENT', 0.98))
+    
+    # Detection results cached by SHA-256 of the image bytes + crop_type + model
+    # version (artifact path and mtime of each model, plus MODEL_VERSION, which
+    # can be bumped to invalidate every entry). RESULT_CACHE_SIZE=0 disables the
+    # cache; RESULT_CACHE_MONGO adds a tier shared by all workers in detection_cache
+    MODEL_VERSION = os.getenv('MODEL_VERSION', '1')
+    RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 1024))
+    RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 24 * 3600))
+    RESULT_CACHE_MONGO = os.getenv('RESULT_CACHE_MONGO', 'false').lower() == 'true'
+    
+    # Reuse a user's earlier diagnosis when a re-photographed or recompressed
+    # copy of the same leaf (perceptual hash within NEAR_DUPLICATE_MAX_DISTANCE
+    # bits, at most 7) is uploaded within NEAR_DUPLICATE_WINDOW_HOURS
+    NEAR_DUPLICATE_LOOKUP = os.getenv('NEAR_DUPLICATE_LOOKUP', 'true').lower() == 'true'
+    NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 6))
+    NEAR_DUPLICATE_WINDOW_HOURS = int(os.getenv('NEAR_DUPLICATE_WINDOW_HOURS', 72))
+    
+    # Gemini recommendations cached by (crop, disease, severity band, weather
+    # buckets, region, language); the MongoDB tier is shared by all workers
+    RECOMMENDATION_CACHE_SIZE = int(os.getenv('RECOMMENDATION_CACHE_SIZE', 2048))
+    RECOMMENDATION_CACHE_TTL = int(os.getenv('RECOMMENDATION_CACHE_TTL', 6 * 3600))
+    RECOMMENDATION_CACHE_MONGO = os.getenv('RECOMMENDATION_CACHE_MONGO', 'true').lower() == 'true'
+    
+    # /analyze runs location/weather lookups concurrently with inference. Stage
+    # deadlines in seconds: location and location+weather are measured from the
+    # start of the request, recommendations from when generation starts.
+    # Missed deadlines fall back to LocationAgent / DecisionAgent defaults.
+    # Location/weather and Gemini calls use separate pools, so slow Gemini
+    # calls can never hold the threads the short lookups need
+    ANALYZE_WORKERS = int(os.getenv('ANALYZE_WORKERS', 16))
+    ANALYZE_GEMINI_WORKERS = int(os.getenv('ANALYZE_GEMINI_WORKERS', 16))
+    LOCATION_TIMEOUT = float(os.getenv('LOCATION_TIMEOUT', 2))
+    WEATHER_TIMEOUT = float(os.getenv('WEATHER_TIMEOUT', 3))
+    RECOMMENDATION_TIMEOUT = float(os.getenv('RECOMMENDATION_TIMEOUT', 20))
+    
+    # Outbound HTTP (ip-api, OpenWeatherMap, Open-Meteo): pooled keep-alive
+    # connections per host, timeouts in seconds, retries with jittered backoff,
+    # and a per-host circuit breaker that opens after HTTP_BREAKER_THRESHOLD
+    # consecutive failures and probes again after HTTP_BREAKER_RESET seconds
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 2))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 5))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+    HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.2))
+    HTTP_BREAKER_THRESHOLD = int(os.getenv('HTTP_BREAKER_THRESHOLD', 5))
+    HTTP_BREAKER_RESET = float(os.getenv('HTTP_BREAKER_RESET', 30))
+    
+    # IP geolocation. 'local' only uses the offline range table built by
+    # `python -m utils.geoip import <csv|mmdb>`, 'http' only ip-api.com, and
+    # 'local+http' tries the table first. Results are cached per /24 (IPv4)
+    # or /48 (IPv6) prefix; failed lookups are cached for GEOIP_FAILURE_TTL
+    GEOIP_MODE = os.getenv('GEOIP_MODE', 'local+http')
+    GEOIP_DATABASE = os.getenv('GEOIP_DATABASE', os.path.join('models', 'geoip.bin'))
+    GEOIP_CACHE_SIZE = int(os.getenv('GEOIP_CACHE_SIZE', 10000))
+    GEOIP_CACHE_TTL = int(os.getenv('GEOIP_CACHE_TTL', 24 * 3600))
+    GEOIP_FAILURE_TTL = int(os.getenv('GEOIP_FAILURE_TTL', 60))
+    
+    # Weather cached per geohash cell (WEATHER_CACHE_PRECISION characters, 5 is
+    # about 5 x 5 km) and WEATHER_CACHE_TTL-second time bucket; the MongoDB
+    # tier in weather_cache is shared by all workers. WEATHER_CACHE_SIZE=0 disables
+    WEATHER_CACHE_SIZE = int(os.getenv('WEATHER_CACHE_SIZE', 4096))
+    WEATHER_CACHE_PRECISION = int(os.getenv('WEATHER_CACHE_PRECISION', 5))
+    WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 1800))
+    WEATHER_CACHE_MONGO = os.getenv('WEATHER_CACHE_MONGO', 'true').lower() == 'true'
+    
+    # Two-phase /analyze: return the diagnosis immediately and generate
+    # recommendations in the background (poll /recommendations/<id> or stream
+    # /recommendations/<id>/events). Clients can also send two_phase=true.
+    # The bundled analysis page follows the events stream (polling as fallback).
+    ANALYZE_TWO_PHASE = os.getenv('ANALYZE_TWO_PHASE', 'false').lower() == 'true'
+    RECOMMENDATION_WORKERS = int(os.getenv('RECOMMENDATION_WORKERS', 8))
+    # Stream Gemini output and emit each recommendation section ('section'
+    # events on the SSE stream) as soon as it has been generated
+    STREAM_RECOMMENDATIONS = os.getenv('STREAM_RECOMMENDATIONS', 'true').lower() == 'true'
+    
     # Supported Languages
     LANGUAGES = {
         'en': 'English',
@@ -38,6 +172,15 @@ class Config:
         'pa': 'ਪੰਜਾਬੀ (Punjabi)'
     }
     
+    # Pre-generated advice (python -m utils.advisory_corpus). 'off' always asks
+    # Gemini, 'corpus' serves baseline documents instantly, 'corpus+delta' adds a
+    # short weather-specific Gemini update. The corpus is also the fallback.
+    ADVISORY_CORPUS_MODE = os.getenv('ADVISORY_CORPUS_MODE', 'off')
+    ADVISORY_CORPUS_VERSION = int(os.getenv('ADVISORY_CORPUS_VERSION', 1))
+    
+    # Strings per Gemini call when translating whole documents
+    TRANSLATION_BATCH_SIZE = int(os.getenv('TRANSLATION_BATCH_SIZE', 60))
+    
     # Image Processing
     IMG_SIZE = (256, 256)
     
@@ -1,17 +1,189 @@
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, UpdateOne
+from collections import defaultdict
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from config import Config
+from utils import phash as perceptual_hash
+from utils.outbreaks import OutbreakTracker
+
+EPOCH = datetime(1970, 1, 1)
+
+def as_object_id(value):
+    """ObjectId form of a detection id given as a string (as in URLs)"""
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value
+
+def rollup_key(value):
+    """Field-name-safe form of a counter key (no dots or leading $)"""
+    return str(value or 'Unknown').replace('.', '_').lstrip('$') or 'Unknown'
+
+def rollup_increments(detection, count=1):
+    """$inc document counting a detection per crop, disease, region and day"""
+    crop = rollup_key(detection['crop_type'])
+    region = (detection.get('location') or {}).get('region')
+    return {
+        'total': count,
+        f'by_crop.{crop}': count,
+        f"by_disease.{crop}.{rollup_key(detection['disease'])}": count,
+        f'by_region.{rollup_key(region)}': count,
+        f"by_day.{detection['timestamp']:%Y-%m-%d}": count
+    }
+
+def rollup_counters(detections, match):
+    """{scope: {counter field: count}} for the global and per-user rollups of matching detections"""
+    groups = detections.aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': {
+                'user_id': '$user_id',
+                'crop_type': '$crop_type',
+                'disease': '$disease',
+                'region': '$location.region',
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}}
+            },
+            'count': {'$sum': 1}
+        }}
+    ], allowDiskUse=True)
+
+    rollups = defaultdict(lambda: defaultdict(int))
+    for group in groups:
+        key = group['_id']
+        detection = {
+            'crop_type': key.get('crop_type'),
+            'disease': key.get('disease'),
+            'location': {'region': key.get('region')},
+            'timestamp': datetime.strptime(key['day'], '%Y-%m-%d')
+        }
+        increments = rollup_increments(detection, group['count'])
+        for scope in ('global', f"user:{key.get('user_id')}"):
+            for field, count in increments.items():
+                rollups[scope][field] += count
+    return rollups
+
+def nest_counters(counters):
+    """Rollup document shape of flat dotted counter fields"""
+    doc = {}
+    for field, count in counters.items():
+        *parents, name = field.split('.')
+        node = doc
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = count
+    return doc
+
+def encode_cursor(detection):
+    """Opaque page cursor: millisecond timestamp and _id of the last row"""
+    millis = (detection['timestamp'] - EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}-{detection['_id']}"
+
+def keyset_filter(cursor):
+    """Query clause selecting rows after a cursor in (timestamp, _id) desc order"""
+    if not cursor:
+        return {}
+    try:
+        millis, last_id = cursor.split('-', 1)
+        timestamp = EPOCH + timedelta(milliseconds=int(millis))
+        last_id = ObjectId(last_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return {'$or': [
+        {'timestamp': {'$lt': timestamp}},
+        {'timestamp': timestamp, '_id': {'$lt': last_id}}
+    ]}
+
+def uses_collection_scan(explain):
+    """Whether an explain() result has a COLLSCAN in any winning plan"""
+    if isinstance(explain, list):
+        return any(uses_collection_scan(item) for item in explain)
+    if not isinstance(explain, dict):
+        return False
+    if 'rejectedPlans' in explain:
+        explain = {key: value for key, value in explain.items() if key != 'rejectedPlans'}
+    if explain.get('stage') == 'COLLSCAN':
+        return True
+    return any(uses_collection_scan(value) for value in explain.values())
 
 class Database:
+    # Fields the history page shows; skips full location and hash fields
+    HISTORY_FIELDS = {
+        'crop_type': 1,
+        'disease': 1,
+        'confidence': 1,
+        'timestamp': 1,
+        'status': 1,
+        'location.city': 1,
+        'location.region': 1
+    }
+    
     def __init__(self):
         self.client = MongoClient(Config.MONGODB_URI)
         self.db = self.client[Config.DATABASE_NAME]
         self.detections = self.db.detections
         self.users = self.db.users
         self.recommendations = self.db.recommendations
+        self.detection_cache = self.db.detection_cache
+        self.recommendation_cache = self.db.recommendation_cache
+        self.translation_memory = self.db.translation_memory
+        self.weather_cache = self.db.weather_cache
+        # Counter documents maintained by save_detection: 'global' and 'user:<id>'
+        self.statistics = self.db.statistics
+        self.outbreaks = OutbreakTracker(
+            self.db.outbreak_counts,
+            self.db.outbreak_alerts,
+            precision=Config.OUTBREAK_GEOHASH_PRECISION,
+            window_days=Config.OUTBREAK_WINDOW_DAYS,
+            baseline_windows=Config.OUTBREAK_BASELINE_WINDOWS,
+            z_threshold=Config.OUTBREAK_Z_THRESHOLD,
+            min_count=Config.OUTBREAK_MIN_COUNT
+        )
+        self.ensure_indexes()
+    
+    def ensure_indexes(self):
+        """Create the indexes every hot query relies on (no-op if they exist)"""
+        try:
+            # _id breaks timestamp ties for keyset pagination
+            self.detections.create_index([('user_id', 1), ('timestamp', -1), ('_id', -1)])
+            self.detections.create_index([('crop_type', 1), ('timestamp', -1)])
+            self.detections.create_index([('user_id', 1), ('phash_chunks', 1), ('timestamp', -1)])
+            self.recommendations.create_index('detection_id')
+        except Exception as e:
+            print(f"Error creating indexes: {e}")
+        try:
+            # Superseded by the (user_id, timestamp, _id) index; only costs writes now
+            self.detections.drop_index([('user_id', 1), ('timestamp', -1)])
+        except OperationFailure:
+            pass  # Already dropped (or never created)
+        except Exception as e:
+            print(f"Error dropping old index: {e}")
+    
+    def hot_queries(self):
+        """(name, explain output) of the queries served on every page view"""
+        sample_user = 'index-check'
+        sample_id = ObjectId()
+        return [
+            ('user history', self.detections.find(
+                {'user_id': sample_user}, self.HISTORY_FIELDS
+            ).sort([('timestamp', -1), ('_id', -1)]).limit(21).explain()),
+            ('recommendations by detection', self.recommendations.find(
+                {'detection_id': sample_id}
+            ).limit(1).explain()),
+            ('recent detections by crop', self.detections.find(
+                {'crop_type': 'tomato'}
+            ).sort('timestamp', -1).limit(10).explain()),
+            ('user statistics', self.statistics.find(
+                {'_id': f'user:{sample_user}'}
+            ).limit(1).explain())
+        ]
+    
+    def check_indexes(self):
+        """Raise RuntimeError if any hot query would scan a whole collection"""
+        scans = [name for name, plan in self.hot_queries() if uses_collection_scan(plan)]
+        if scans:
+            raise RuntimeError(f"Queries without an index (COLLSCAN): {', '.join(scans)}")
         
-    def save_detection(self, user_id, image_path, crop_type, disease, confidence, location, language='en'):
+    def save_detection(self, user_id, image_path, crop_type, disease, confidence, location, language='en', phash=None):
         """Save disease detection result"""
         detection = {
             'user_id': user_id,
@@ -24,23 +196,87 @@ class Database:
             'timestamp': datetime.utcnow(),
             'status': 'active'
         }
-        return self.detections.insert_one(detection).inserted_id
+        if phash is not None:
+            detection['phash'] = perceptual_hash.to_hex(phash)
+            detection['phash_chunks'] = perceptual_hash.chunk_keys(phash)
+        detection_id = self.detections.insert_one(detection).inserted_id
+        self.update_statistics(detection)
+        if Config.OUTBREAK_TRACKING:
+            self.outbreaks.record(detection)
+        return detection_id
+    
+    def update_statistics(self, detection):
+        """Count a new detection in the global and per-user rollups"""
+        increments = rollup_increments(detection)
+        try:
+            self.statistics.bulk_write([
+                UpdateOne({'_id': 'global'}, {'$inc': increments}, upsert=True),
+                UpdateOne({'_id': f"user:{detection['user_id']}"}, {'$inc': increments}, upsert=True)
+            ], ordered=False)
+        except Exception as e:
+            print(f"Error updating statistics: {e}")
+    
+    def find_similar_detection(self, user_id, phash, max_distance, since, **filters):
+        """Most recent detection of this user whose image hash is within max_distance
+        
+        Multi-index hashing: candidates share at least one exact 8-bit chunk
+        with the query (guaranteed for distance <= 7) and are found through
+        the (user_id, phash_chunks, timestamp) index; only those few are
+        compared bit by bit.
+        """
+        max_distance = min(max_distance, perceptual_hash.MAX_INDEXED_DISTANCE)
+        candidates = self.detections.find(
+            {
+                'user_id': user_id,
+                'phash_chunks': {'$in': perceptual_hash.chunk_keys(phash)},
+                'timestamp': {'$gte': since},
+                **filters
+            },
+            {'phash_chunks': 0}
+        ).sort('timestamp', -1).limit(50)
+        
+        for candidate in candidates:
+            if perceptual_hash.hamming(phash, perceptual_hash.from_hex(candidate['phash'])) <= max_distance:
+                return candidate
+        return None
     
     def save_recommendation(self, detection_id, recommendations, weather_data):
         """Save AI-generated recommendations"""
         rec = {
-            'detection_id': detection_id,
+            'detection_id': as_object_id(detection_id),
             'recommendations': recommendations,
             'weather_data': weather_data,
             'timestamp': datetime.utcnow()
         }
-        return self.recommendations.insert_one(rec).inserted_id
+        rec_id = self.recommendations.insert_one(rec).inserted_id
+        if Config.EMBED_RECOMMENDATIONS:
+            # Copy into the detection so its page is a single document read
+            self.detections.update_one({'_id': rec['detection_id']}, {'$set': {'recommendation': rec}})
+        return rec_id
     
     def get_user_history(self, user_id, limit=10):
         """Get user's detection history"""
-        return list(self.detections.find(
-            {'user_id': user_id}
-        ).sort('timestamp', -1).limit(limit))
+        return self.get_user_history_page(user_id, limit)[0]
+    
+    def get_user_history_page(self, user_id, limit=20, cursor=None):
+        """One page of history, newest first, and the cursor of the next page (or None)
+        
+        Keyset pagination on (timestamp, _id): each page continues after the
+        last row of the previous one, so deep pages cost the same as the first.
+        """
+        limit = max(1, limit)
+        query = {'user_id': user_id, **keyset_filter(cursor)}
+        items = list(self.detections.find(query, self.HISTORY_FIELDS)
+                     .sort([('timestamp', -1), ('_id', -1)])
+                     .limit(limit + 1))
+        next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+        return items[:limit], next_cursor
+    
+    def iter_user_detections(self, user_id, fields=None, batch_size=500):
+        """Server-side cursor over all of a user's detections, newest first"""
+        return self.detections.find(
+            {'user_id': user_id}, fields or self.HISTORY_FIELDS, batch_size=batch_size
+        ).sort([('timestamp', -1), ('_id', -1)])
     
     def get_detection_by_id(self, detection_id):
         """Get specific detection"""
@@ -48,7 +284,40 @@ class Database:
     
     def get_recommendations(self, detection_id):
         """Get recommendations for a detection"""
-        return self.recommendations.find_one({'detection_id': detection_id})
+        return self.recommendations.find_one(
+            {'detection_id': as_object_id(detection_id)}, sort=[('timestamp', -1)]
+        )
+    
+    def get_detection_with_recommendations(self, detection_id):
+        """Detection with its latest recommendations under 'recommendation', in one query
+        
+        Reads the embedded copy when EMBED_RECOMMENDATIONS is on (and the
+        detection has one), otherwise joins with a $lookup on the
+        recommendations.detection_id index.
+        """
+        detection_id = as_object_id(detection_id)
+        if not isinstance(detection_id, ObjectId):
+            return None
+        if Config.EMBED_RECOMMENDATIONS:
+            detection = self.detections.find_one({'_id': detection_id})
+            if detection is None or 'recommendation' in detection:
+                return detection
+        
+        results = list(self.detections.aggregate([
+            {'$match': {'_id': detection_id}},
+            {'$lookup': {
+                'from': self.recommendations.name,
+                'let': {'detection_id': '$_id'},
+                'pipeline': [
+                    {'$match': {'$expr': {'$eq': ['$detection_id', '$$detection_id']}}},
+                    {'$sort': {'timestamp': -1}},
+                    {'$limit': 1}
+                ],
+                'as': 'recommendation'
+            }},
+            {'$addFields': {'recommendation': {'$arrayElemAt': ['$recommendation', 0]}}}
+        ]))
+        return results[0] if results else None
     
     def update_detection_status(self, detection_id, status):
         """Update detection status"""
@@ -58,14 +327,41 @@ class Database:
         )
     
     def get_statistics(self, user_id=None):
-        """Get usage statistics"""
-        query = {'user_id': user_id} if user_id else {}
-        total = self.detections.count_documents(query)
-        by_crop = list(self.detections.aggregate([
-            {'$match': query},
-            {'$group': {'_id': '$crop_type', 'count': {'$sum': 1}}}
-        ]))
+        """Get usage statistics (one read of the rollup document)"""
+        scope = f'user:{user_id}' if user_id else 'global'
+        rollup = self.statistics.find_one({'_id': scope})
+        if not rollup or not rollup.get('complete'):
+            rollup = self.seed_statistics(scope, user_id)
         return {
-            'total_detections': total,
-            'by_crop': {item['_id']: item['count'] for item in by_crop}
-        }
\ No newline at end of file
+            'total_detections': rollup.get('total', 0),
+            'by_crop': rollup.get('by_crop', {}),
+            'by_disease': rollup.get('by_disease', {}),
+            'by_region': rollup.get('by_region', {}),
+            'by_day': rollup.get('by_day', {})
+        }
+    
+    def seed_statistics(self, scope, user_id=None):
+        """Count a rollup from the raw detections and store it, marked complete
+        
+        Covers detections saved before the rollups existed: a rollup created
+        only by update_statistics' $inc is missing them. Runs once per scope.
+        """
+        counters = rollup_counters(self.detections, {'user_id': user_id} if user_id else {}).get(scope, {})
+        try:
+            self.statistics.update_one(
+                {'_id': scope, 'complete': {'$ne': True}},
+                {'$set': {**counters, 'complete': True}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # Seeded concurrently
+        except Exception as e:
+            print(f"Error seeding statistics: {e}")
+        return nest_counters(counters)
+
+
+if __name__ == '__main__':
+    # python database.py: create indexes and verify the hot queries use them
+    db = Database()
+    db.check_indexes()
+    print("All hot queries use an index")
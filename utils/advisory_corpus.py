@@ -0,0 +1,139 @@
+"""Pre-generated advisory corpus for every crop x disease x language.
+
+Each entry is a baseline recommendations document (same JSON schema as
+DecisionAgent.generate_recommendations) written without a particular
+location or weather in mind. The corpus is a gzipped JSON file per version,
+models/advisory_corpus.v{N}.json.gz, so a new prompt or model can be
+rolled out as a new version without touching the one being served.
+
+Build (resumable: finished entries are kept and skipped on re-run):
+    python -m utils.advisory_corpus --concurrency 4 [--languages en hi]
+"""
+import argparse
+import copy
+import gzip
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import logging
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def corpus_path(version=None):
+    version = version or Config.ADVISORY_CORPUS_VERSION
+    return os.path.join(Config.MODEL_PATH, f'advisory_corpus.v{version}.json.gz')
+
+
+def entry_key(crop, disease, language):
+    return f'{crop}|{disease}|{language}'
+
+
+class AdvisoryCorpus:
+    def __init__(self, path=None, version=None):
+        self.path = path or corpus_path(version)
+        self.version = version or Config.ADVISORY_CORPUS_VERSION
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data.get('entries', {})
+            self.version = data.get('version', self.version)
+
+    def get(self, crop, disease, language):
+        """Baseline document for a diagnosis, or None (a copy, safe to modify)"""
+        entry = self.entries.get(entry_key(crop, disease, language))
+        return copy.deepcopy(entry) if entry is not None else None
+
+    def put(self, crop, disease, language, recommendations):
+        with self.lock:
+            self.entries[entry_key(crop, disease, language)] = recommendations
+
+    def __contains__(self, key):
+        return entry_key(*key) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def save(self):
+        """Write the corpus atomically so a crash never leaves a torn file"""
+        with self.lock:
+            data = {
+                'version': self.version,
+                'generated_at': datetime.utcnow().isoformat(),
+                'entries': dict(self.entries)
+            }
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, self.path)
+
+
+def corpus_combinations(languages=None):
+    from agents.vision_agent import CLASS_NAMES
+    for crop, diseases in CLASS_NAMES.items():
+        for disease in diseases:
+            for language in languages or Config.LANGUAGES:
+                yield crop, disease, language
+
+
+def generate_entry(decision_agent, crop, disease, language):
+    detection = {
+        'crop': crop,
+        'disease': disease,
+        'confidence': 1.0,
+        'is_healthy': 'Healthy' in disease
+    }
+    prompt = decision_agent.build_prompt(detection, None, None, language)
+    return decision_agent.request_recommendations(prompt)
+
+
+def build(decision_agent, corpus, languages=None, concurrency=4, checkpoint_every=10):
+    """Generate every missing entry with bounded concurrency, checkpointing as it goes"""
+    todo = [combo for combo in corpus_combinations(languages) if combo not in corpus]
+    print(f"{len(corpus)} entries present, {len(todo)} to generate")
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(generate_entry, decision_agent, *combo): combo
+            for combo in todo
+        }
+        for future in as_completed(futures):
+            crop, disease, language = futures[future]
+            try:
+                corpus.put(crop, disease, language, future.result())
+                done += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"{crop}/{disease}/{language} failed: {str(e)}")
+                continue
+            if done % checkpoint_every == 0:
+                corpus.save()
+                print(f"{done}/{len(todo)} generated")
+
+    corpus.save()
+    print(f"Generated {done}, failed {failed}; corpus v{corpus.version} has {len(corpus)} entries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--version', type=int, default=Config.ADVISORY_CORPUS_VERSION)
+    parser.add_argument('--languages', nargs='*', default=None)
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Concurrent Gemini requests')
+    args = parser.parse_args()
+
+    from agents.decision_agent import DecisionAgent
+    corpus = AdvisoryCorpus(version=args.version)
+    build(DecisionAgent(), corpus, args.languages, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import copy
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with an optional per-entry TTL (seconds)"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (self.ttl is None or entry[1] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class MongoCache:
+    """Cache tier stored in a MongoDB collection with a TTL index
+
+    Shared by every worker process. MongoDB purges expired documents in the
+    background (about once a minute), so expiry is also checked on read.
+    """
+
+    def __init__(self, collection, ttl):
+        self.collection = collection
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        try:
+            self.collection.create_index('expires_at', expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"Could not create TTL index on {collection.name}: {str(e)}")
+
+    def get(self, key, default=None):
+        try:
+            doc = self.collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Cache read from {self.collection.name} failed: {str(e)}")
+            return default
+        if doc is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return doc['value']
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        try:
+            self.collection.update_one(
+                {'_id': key},
+                {'$set': {
+                    'value': value,
+                    'expires_at': datetime.utcnow() + timedelta(seconds=ttl)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Cache write to {self.collection.name} failed: {str(e)}")
+
+    def delete(self, key):
+        try:
+            self.collection.delete_one({'_id': key})
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Cache delete from {self.collection.name} failed: {str(e)}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class TieredCache:
+    """In-process LRU in front of an optional shared (MongoDB) tier
+
+    Values are deep-copied on the way in and out so callers can mutate what
+    they get back without corrupting the cache.
+    """
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return copy.deepcopy(value) if value is not None else default
+
+    def set(self, key, value, ttl=None):
+        value = copy.deepcopy(value)
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def stats(self):
+        stats = {'local': self.local.stats()}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                leader = True
+                self.executed += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            call['done'].wait()
+        else:
+            try:
+                call['result'] = func(*args, **kwargs)
+            except Exception as e:
+                call['error'] = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call['done'].set()
+
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+    def stats(self):
+        return {
+            'in_flight': len(self.calls),
+            'executed': self.executed,
+            'coalesced': self.coalesced
+        }
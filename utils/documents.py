@@ -0,0 +1,28 @@
+def collect_strings(document):
+    """All leaf strings of a nested dict/list structure, depth-first"""
+    if isinstance(document, str):
+        return [document]
+    if isinstance(document, dict):
+        values = document.values()
+    elif isinstance(document, (list, tuple)):
+        values = document
+    else:
+        return []
+    strings = []
+    for value in values:
+        strings.extend(collect_strings(value))
+    return strings
+
+
+def replace_strings(document, replacements):
+    """Copy of a structure with its leaf strings taken in order from an iterator
+
+    Pairs with collect_strings(): both walk the structure in the same order.
+    """
+    if isinstance(document, str):
+        return next(replacements)
+    if isinstance(document, dict):
+        return {key: replace_strings(value, replacements) for key, value in document.items()}
+    if isinstance(document, (list, tuple)):
+        return [replace_strings(value, replacements) for value in document]
+    return document
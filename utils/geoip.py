@@ -0,0 +1,262 @@
+"""Offline IP -> location lookup over a compact sorted-range table.
+
+The table is a single binary file, memory-mapped and binary-searched in
+place, so opening it costs nothing and lookups never leave the process:
+
+    header   b'GEOIPv1\\0', record count, offset and length of the location table
+    records  count x (start: 16 bytes, end: 16 bytes, location index: uint32)
+    table    UTF-8 JSON list of location dicts (same shape as LocationAgent)
+
+Addresses are stored as 16-byte big-endian IPv6 (IPv4 as ::ffff:a.b.c.d),
+so raw bytes compare in address order. Records are sorted by start and do
+not overlap.
+
+Build from a CSV (DB-IP "IP to City Lite" layout, or any CSV with a header
+naming start_ip/end_ip or network plus city/region/country/lat/lon columns)
+or from a MaxMind .mmdb file (needs the optional maxminddb package):
+    python -m utils.geoip import dbip-city-lite.csv
+    python -m utils.geoip import GeoLite2-City.mmdb
+    python -m utils.geoip lookup 49.36.0.1
+"""
+import argparse
+import csv
+import ipaddress
+import itertools
+import json
+import mmap
+import os
+import struct
+
+from config import Config
+
+MAGIC = b'GEOIPv1\0'
+HEADER = struct.Struct('>8sIQQ')
+RECORD = struct.Struct('>16s16sI')
+
+# Column names accepted in header CSVs, first match wins
+CSV_COLUMNS = {
+    'start': ('start_ip', 'ip_start', 'ip_from', 'start'),
+    'end': ('end_ip', 'ip_end', 'ip_to', 'end'),
+    'network': ('network', 'cidr'),
+    'city': ('city', 'city_name'),
+    'region': ('region', 'region_name', 'stateprov', 'subdivision_1_name'),
+    'country': ('country', 'country_name', 'country_code'),
+    'lat': ('lat', 'latitude'),
+    'lon': ('lon', 'lng', 'longitude'),
+    'timezone': ('timezone', 'time_zone'),
+    'zip': ('zip', 'postal_code', 'postcode')
+}
+
+# Header-less DB-IP lite city CSV
+DBIP_COLUMNS = ['start', 'end', 'continent', 'country', 'region', 'city', 'lat', 'lon']
+
+
+def address_bytes(ip):
+    """16-byte sortable form of an IPv4 or IPv6 address"""
+    address = ipaddress.ip_address(ip)
+    if address.version == 4:
+        return b'\0' * 10 + b'\xff\xff' + address.packed
+    return address.packed
+
+
+def ip_prefix(ip):
+    """Cache key covering the address's /24 (IPv4) or /48 (IPv6) network"""
+    address = ipaddress.ip_address(ip)
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+def make_location(city=None, region=None, country=None, lat=None, lon=None, timezone=None, zip=None):
+    return {
+        'city': city or 'Unknown',
+        'region': region or 'Unknown',
+        'country': country or 'Unknown',
+        'lat': round(float(lat), 4) if lat not in (None, '') else None,
+        'lon': round(float(lon), 4) if lon not in (None, '') else None,
+        'timezone': timezone or '',
+        'zip': zip or ''
+    }
+
+
+class GeoIPDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, table_offset, table_length = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a GeoIP range table")
+        self.locations = json.loads(self.data[table_offset:table_offset + table_length].decode('utf-8'))
+        self.lookups = 0
+        self.found = 0
+
+    @classmethod
+    def open(cls, path):
+        """Database at path, or None if it does not exist or cannot be read"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            print(f"Error opening GeoIP database {path}: {e}")
+            return None
+
+    def record_start(self, index):
+        offset = HEADER.size + index * RECORD.size
+        return self.data[offset:offset + 16]
+
+    def lookup(self, ip):
+        """Location dict for an address, or None if no range contains it"""
+        try:
+            key = address_bytes(ip)
+        except ValueError:
+            return None
+        self.lookups += 1
+
+        # Last record whose start <= key
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record_start(middle) <= key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return None
+        _, end, location_index = RECORD.unpack_from(self.data, HEADER.size + (low - 1) * RECORD.size)
+        if key > end:
+            return None
+        self.found += 1
+        return dict(self.locations[location_index])
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'ranges': self.count,
+            'locations': len(self.locations),
+            'lookups': self.lookups,
+            'found': self.found
+        }
+
+
+def write_database(ranges, path):
+    """Write (start_ip, end_ip, location) tuples as a range table at path"""
+    location_index = {}
+    locations = []
+    records = []
+    for start, end, location in ranges:
+        start, end = address_bytes(start), address_bytes(end)
+        if end < start:
+            continue
+        key = json.dumps(location, sort_keys=True)
+        if key not in location_index:
+            location_index[key] = len(locations)
+            locations.append(location)
+        records.append((start, end, location_index[key]))
+    records.sort()
+
+    # Drop overlaps and merge adjacent ranges that share a location
+    merged = []
+    for start, end, index in records:
+        if merged and start <= merged[-1][1]:
+            continue
+        if merged and merged[-1][2] == index and \
+                int.from_bytes(start, 'big') == int.from_bytes(merged[-1][1], 'big') + 1:
+            merged[-1][1] = end
+            continue
+        merged.append([start, end, index])
+
+    table = json.dumps(locations, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    table_offset = HEADER.size + len(merged) * RECORD.size
+    temp_path = path + '.tmp'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(merged), table_offset, len(table)))
+        for start, end, index in merged:
+            f.write(RECORD.pack(start, end, index))
+        f.write(table)
+    os.replace(temp_path, path)
+    return len(merged), len(locations)
+
+
+def read_csv(path):
+    """(start_ip, end_ip, location) tuples from a header or DB-IP layout CSV"""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.reader(f)
+        first = next(rows)
+        try:
+            ipaddress.ip_address(first[0])
+            columns = {name: i for i, name in enumerate(DBIP_COLUMNS)}
+            rows = itertools.chain([first], rows)
+        except ValueError:
+            header = [name.strip().lower() for name in first]
+            columns = {}
+            for field, aliases in CSV_COLUMNS.items():
+                for alias in aliases:
+                    if alias in header:
+                        columns[field] = header.index(alias)
+                        break
+
+        for row in rows:
+            value = {field: row[i] for field, i in columns.items() if i < len(row)}
+            if 'network' in value:
+                network = ipaddress.ip_network(value.pop('network'), strict=False)
+                start, end = network.network_address, network.broadcast_address
+            else:
+                start, end = value.pop('start'), value.pop('end')
+            value.pop('continent', None)
+            yield str(start), str(end), make_location(**value)
+
+
+def read_mmdb(path):
+    """(start_ip, end_ip, location) tuples from a MaxMind City database"""
+    try:
+        import maxminddb
+    except ImportError:
+        raise SystemExit("Reading .mmdb files needs the maxminddb package (pip install maxminddb)")
+
+    with maxminddb.open_database(path) as reader:
+        for network, record in reader:
+            if not record:
+                continue
+            subdivisions = record.get('subdivisions') or [{}]
+            geo = record.get('location', {})
+            yield str(network.network_address), str(network.broadcast_address), make_location(
+                city=record.get('city', {}).get('names', {}).get('en'),
+                region=subdivisions[0].get('names', {}).get('en'),
+                country=record.get('country', {}).get('names', {}).get('en'),
+                lat=geo.get('latitude'),
+                lon=geo.get('longitude'),
+                timezone=geo.get('time_zone'),
+                zip=record.get('postal', {}).get('code')
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('import', help='Build the range table from a CSV or .mmdb file')
+    build.add_argument('source')
+    build.add_argument('--output', default=Config.GEOIP_DATABASE)
+    lookup = subparsers.add_parser('lookup', help='Look up addresses in the range table')
+    lookup.add_argument('ips', nargs='+')
+    lookup.add_argument('--database', default=Config.GEOIP_DATABASE)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        reader = read_mmdb if args.source.endswith('.mmdb') else read_csv
+        ranges, locations = write_database(reader(args.source), args.output)
+        size = os.path.getsize(args.output) / 1e6
+        print(f"Wrote {ranges} ranges, {locations} locations to {args.output} ({size:.1f} MB)")
+    else:
+        database = GeoIPDatabase(args.database)
+        for ip in args.ips:
+            print(ip, database.lookup(ip))
+
+
+if __name__ == '__main__':
+    main()
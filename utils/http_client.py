@@ -0,0 +1,196 @@
+"""Shared HTTP client for the external APIs (ip-api, OpenWeatherMap, Open-Meteo).
+
+One requests.Session keeps connections alive per host (at most
+HTTP_POOL_MAXSIZE each), so repeated calls skip the TCP/TLS handshake.
+Failed calls are retried a bounded number of times with full-jitter
+exponential backoff, and a per-host circuit breaker stops calling a host
+that keeps failing: while it is open, calls raise CircuitOpenError at once
+so callers drop straight to their defaults instead of waiting on timeouts.
+
+429 (rate limited) is never retried: retrying extends the throttle (and
+ip-api.com bans clients that keep going). It opens the host's breaker at
+once for as long as Retry-After / X-Ttl asks, or HTTP_BREAKER_RESET.
+"""
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import threading
+from urllib.parse import urlsplit
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {500, 502, 503, 504}
+RATE_LIMITED = 429
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `reset_timeout`
+    seconds one trial call is let through (half-open) to probe the host"""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.open_until = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.open_until is None:
+            return 'closed'
+        if time.monotonic() >= self.open_until:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = None
+            self.trial_running = False
+
+    def record_failure(self, open_for=None):
+        """Count a failure; `open_for` opens the breaker at once for that many seconds"""
+        with self.lock:
+            self.failures += 1
+            if open_for is not None or self.trial_running or self.failures >= self.threshold:
+                self.open_until = time.monotonic() + (open_for if open_for is not None else self.reset_timeout)
+            self.trial_running = False
+
+
+class HTTPClient:
+    def __init__(self, pool_maxsize=10, timeout=(2, 5), retries=2, backoff=0.2,
+                 breaker_threshold=5, breaker_reset=30):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+
+        self.session = requests.Session()
+        # pool_block caps concurrent connections per host instead of opening extras
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.breakers = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def host_state(self, host):
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+                self.counters[host] = {
+                    'requests': 0, 'retries': 0, 'failures': 0, 'rate_limited': 0, 'short_circuited': 0
+                }
+            return self.breakers[host], self.counters[host]
+
+    def count(self, counters, name):
+        with self.lock:
+            counters[name] += 1
+
+    def get(self, url, params=None, timeout=None):
+        """GET with retries; raises CircuitOpenError while the host's breaker is open"""
+        host = urlsplit(url).netloc
+        breaker, counters = self.host_state(host)
+        if not breaker.allow():
+            self.count(counters, 'short_circuited')
+            raise CircuitOpenError(f"{host} is unavailable (circuit open)")
+
+        attempt = 0
+        while True:
+            self.count(counters, 'requests')
+            try:
+                response = self.session.get(url, params=params, timeout=timeout or self.timeout)
+            except requests.RequestException as e:
+                response, error = None, e
+
+            if response is not None:
+                if response.status_code == RATE_LIMITED:
+                    wait = retry_after(response)
+                    if wait is None:
+                        wait = self.breaker_reset
+                    logger.warning(f"{host} rate limited us, pausing calls for {wait}s")
+                    self.count(counters, 'rate_limited')
+                    breaker.record_failure(open_for=wait)
+                    raise requests.HTTPError(f"429 from {host}", response=response)
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} from {host}", response=response)
+
+            if attempt >= self.retries:
+                logger.warning(f"{host} failed after {attempt + 1} attempts: {str(error)}")
+                self.count(counters, 'failures')
+                breaker.record_failure()
+                raise error
+            attempt += 1
+            self.count(counters, 'retries')
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def stats(self):
+        with self.lock:
+            return {
+                host: dict(self.counters[host], circuit=breaker.state)
+                for host, breaker in self.breakers.items()
+            }
+
+
+def retry_after(response):
+    """Seconds the server asks us to wait (Retry-After, or ip-api's X-Ttl), or None"""
+    for header in ('Retry-After', 'X-Ttl'):
+        value = response.headers.get(header)
+        if not value:
+            continue
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            return max(delay, 0)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def shared_client():
+    """Process-wide client configured from Config"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HTTPClient(
+                pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+                timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT),
+                retries=Config.HTTP_RETRIES,
+                backoff=Config.HTTP_BACKOFF,
+                breaker_threshold=Config.HTTP_BREAKER_THRESHOLD,
+                breaker_reset=Config.HTTP_BREAKER_RESET
+            )
+        return _shared_client
@@ -0,0 +1,55 @@
+import io
+import threading
+import numpy as np
+from PIL import Image
+from config import Config
+
+
+class ImagePreprocessor:
+    """Decode leaf images once, straight into model-ready float32 buffers
+
+    Sources can be a file path, raw bytes or a file-like object (e.g. a
+    Flask upload stream). Large JPEGs are decoded at a reduced DCT scale via
+    draft mode, and the normalised pixels are written into a per-thread
+    preallocated (1, H, W, 3) float32 buffer instead of allocating float64
+    intermediates on every request.
+    """
+
+    def __init__(self, size=None, resample=Image.BICUBIC):
+        self.size = tuple(size or Config.IMG_SIZE)
+        self.resample = resample
+        self.scale = np.float32(1.0 / 255.0)
+        self.local = threading.local()
+
+    def buffer(self):
+        """This thread's reusable input buffer"""
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = np.empty((1, self.size[1], self.size[0], 3), dtype=np.float32)
+            self.local.buffer = buffer
+        return buffer
+
+    def open(self, source):
+        """Open an image from a path, bytes or file object"""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        img = Image.open(source)
+        # JPEG only: decode at 1/2, 1/4 or 1/8 scale while staying >= target size
+        img.draft('RGB', self.size)
+        return img
+
+    def load(self, source, out=None):
+        """Preprocess an image into a (1, H, W, 3) float32 array in [0, 1]
+
+        Without `out`, the returned array is this thread's shared buffer and
+        is overwritten by the thread's next call.
+        """
+        img = self.open(source)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        # reducing_gap applies a cheap integer reduce() before the final resample
+        img = img.resize(self.size, self.resample, reducing_gap=2.0)
+
+        out = self.buffer() if out is None else out
+        np.multiply(np.asarray(img), self.scale, out=out[0], dtype=np.float32)
+        return out
@@ -0,0 +1,98 @@
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.events = []
+        self.finished_at = None
+        self.condition = threading.Condition()
+
+
+class JobRegistry:
+    """Background jobs whose progress can be polled or streamed
+
+    Every job keeps an append-only event list; subscribers replay it from
+    the start and then block for new events, so a client that connects
+    late (or reconnects) still sees everything. Finished jobs are kept for
+    `retention` seconds; after that their results are only in MongoDB.
+    """
+
+    def __init__(self, executor, retention=600):
+        self.executor = executor
+        self.retention = retention
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job_id, func, *args, **kwargs):
+        """Run func(job, *args) in the background under job_id"""
+        job = Job(job_id)
+        with self.lock:
+            self._prune()
+            self.jobs[job_id] = job
+        self.executor.submit(self._run, job, func, *args, **kwargs)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def publish(self, job, event, data=None):
+        with job.condition:
+            job.events.append((event, data))
+            job.condition.notify_all()
+
+    def _run(self, job, func, *args, **kwargs):
+        self.publish(job, 'status', {'status': 'running'})
+        job.status = 'running'
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = 'done'
+            self.publish(job, 'recommendations', job.result)
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)
+            self.publish(job, 'error', {'error': job.error})
+        finally:
+            # Final event and finished flag change together so subscribers never miss it
+            with job.condition:
+                job.events.append(('status', {'status': job.status}))
+                job.finished_at = time.monotonic()
+                job.condition.notify_all()
+
+    def subscribe(self, job, timeout=60):
+        """Yield (event, data) pairs until the job finishes or goes quiet for `timeout`"""
+        index = 0
+        while True:
+            with job.condition:
+                if index >= len(job.events):
+                    if job.finished_at is not None:
+                        return
+                    if not job.condition.wait(timeout):
+                        return
+                events = job.events[index:]
+            index += len(events)
+            for event in events:
+                yield event
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.retention
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def stats(self):
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in ('pending', 'running', 'done', 'failed')}
@@ -0,0 +1,65 @@
+import json
+
+
+class JSONSectionStream:
+    """Incrementally parse a streamed JSON object, one top-level key at a time
+
+    Feed text chunks as they arrive; feed() returns the (key, value) pairs
+    whose values became complete with that chunk. Markdown code fences and
+    any text before the opening brace are ignored. Only the characters of
+    the current section are buffered, and each byte is scanned once.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.finished = False
+        self.section = []
+
+    def feed(self, chunk):
+        sections = []
+        for char in chunk:
+            if self.finished:
+                break
+            if not self.started:
+                if char == '{':
+                    self.started = True
+                    self.depth = 1
+                continue
+
+            if self.in_string:
+                self.section.append(char)
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    # Closing brace of the whole object ends the last section
+                    self._emit(sections)
+                    self.finished = True
+                    continue
+            elif char == ',' and self.depth == 1:
+                self._emit(sections)
+                continue
+            self.section.append(char)
+        return sections
+
+    def _emit(self, sections):
+        text = ''.join(self.section).strip()
+        self.section = []
+        if not text:
+            return
+        key, value = json.loads('{' + text + '}').popitem()
+        sections.append((key, value))
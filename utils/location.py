@@ -1,15 +1,62 @@
-import requests
+import copy
+import time
+import threading
 from config import Config
+from utils import geohash
+from utils.cache import LRUCache, SingleFlight
+from utils.geoip import GeoIPDatabase, ip_prefix
+from utils.http_client import shared_client
+
+# Centre of India, reported when a location cannot be determined
+DEFAULT_COORDINATES = (20.5937, 78.9629)
+
+def is_default_location(location):
+    """Whether a location is the fallback rather than a real lookup result"""
+    return bool(location.get('is_default')) or \
+        (location.get('lat'), location.get('lon')) == DEFAULT_COORDINATES
 
 class LocationAgent:
-    def __init__(self):
+    def __init__(self, weather_cache=None, http=None):
         self.weather_api_key = Config.WEATHER_API_KEY
+        self.http = http or shared_client()
+        self.weather_cache = weather_cache
+        self.weather_flight = SingleFlight()
+        self.upstream_lock = threading.Lock()
+        self.upstream_calls = {'openweathermap': 0, 'open-meteo': 0}
+        self.geoip = GeoIPDatabase.open(Config.GEOIP_DATABASE) if Config.GEOIP_MODE != 'http' else None
+        self.ip_cache = LRUCache(Config.GEOIP_CACHE_SIZE, Config.GEOIP_CACHE_TTL)
     
     def get_location_from_ip(self, ip_address=None):
+        """Get location from IP address: cache, then local database, then ip-api.com"""
+        try:
+            key = ip_prefix(ip_address) if ip_address else 'self'
+        except ValueError:
+            key = ip_address
+        
+        location = self.ip_cache.get(key)
+        if location is not None:
+            return dict(location)
+        
+        if self.geoip and ip_address:
+            location = self.geoip.lookup(ip_address)
+            if location is not None and location['lat'] is None:
+                location = None
+        if location is None and Config.GEOIP_MODE != 'local':
+            location = self.get_location_from_ip_api(ip_address)
+        
+        if location is None:
+            # Default location if detection fails; retried after a short while
+            location = self.get_default_location()
+            self.ip_cache.set(key, location, ttl=Config.GEOIP_FAILURE_TTL)
+        else:
+            self.ip_cache.set(key, location)
+        return dict(location)
+    
+    def get_location_from_ip_api(self, ip_address=None):
         """Get location from IP address using ip-api.com (free)"""
         try:
             url = f"http://ip-api.com/json/{ip_address}" if ip_address else "http://ip-api.com/json/"
-            response = requests.get(url, timeout=5)
+            response = self.http.get(url)
             data = response.json()
             
             if data['status'] == 'success':
@@ -24,24 +71,72 @@ class LocationAgent:
                 }
         except Exception as e:
             print(f"Error getting location: {e}")
-        
-        # Default location if detection fails
+        return None
+    
+    def stats(self):
+        return {
+            'mode': Config.GEOIP_MODE,
+            'database': self.geoip.stats() if self.geoip else None,
+            'cache': self.ip_cache.stats()
+        }
+    
+    def weather_stats(self):
+        return {
+            'cache': self.weather_cache.stats() if self.weather_cache is not None else None,
+            'single_flight': self.weather_flight.stats(),
+            'upstream_calls': dict(self.upstream_calls)
+        }
+    
+    def get_default_location(self):
+        """Location used when IP lookup fails"""
         return {
             'city': 'Unknown',
             'region': 'Unknown',
             'country': 'India',
-            'lat': 20.5937,
-            'lon': 78.9629,
+            'lat': DEFAULT_COORDINATES[0],
+            'lon': DEFAULT_COORDINATES[1],
             'timezone': 'Asia/Kolkata',
-            'zip': ''
+            'zip': '',
+            'is_default': True
         }
     
+    def weather_cache_key(self, lat, lon):
+        """Geohash cell + time bucket, so all workers agree on when an entry expires"""
+        cell = geohash.encode(lat, lon, Config.WEATHER_CACHE_PRECISION)
+        bucket = int(time.time() // Config.WEATHER_CACHE_TTL)
+        return f'{cell}:{bucket}'
+    
     def get_weather(self, lat, lon):
-        """Get weather data from OpenWeatherMap"""
+        """Current weather for the coordinate's cell, fetched at most once per bucket"""
+        if self.weather_cache is None:
+            return self.fetch_weather(lat, lon) or self.get_default_weather()
+        
+        key = self.weather_cache_key(lat, lon)
+        weather = self.weather_cache.get(key)
+        if weather is None:
+            # Concurrent misses for the same cell share one upstream call
+            weather = copy.deepcopy(self.weather_flight.do(key, self.fetch_and_cache_weather, key, lat, lon))
+        return weather or self.get_default_weather()
+    
+    def fetch_and_cache_weather(self, key, lat, lon):
+        weather = self.fetch_weather(lat, lon)
+        if weather is not None:
+            # Expire at the end of the time bucket
+            remaining = Config.WEATHER_CACHE_TTL - time.time() % Config.WEATHER_CACHE_TTL
+            self.weather_cache.set(key, weather, ttl=max(1, int(remaining)))
+        return weather
+    
+    def count_upstream(self, service):
+        with self.upstream_lock:
+            self.upstream_calls[service] += 1
+    
+    def fetch_weather(self, lat, lon):
+        """Get weather data from OpenWeatherMap, or None if no service answers"""
         if not self.weather_api_key:
             return self.get_weather_free(lat, lon)
         
         try:
+            self.count_upstream('openweathermap')
             url = f"https://api.openweathermap.org/data/2.5/weather"
             params = {
                 'lat': lat,
@@ -49,7 +144,7 @@ class LocationAgent:
                 'appid': self.weather_api_key,
                 'units': 'metric'
             }
-            response = requests.get(url, params=params, timeout=5)
+            response = self.http.get(url, params=params)
             data = response.json()
             
             return {
@@ -68,6 +163,7 @@ class LocationAgent:
     def get_weather_free(self, lat, lon):
         """Fallback weather using free API"""
         try:
+            self.count_upstream('open-meteo')
             url = f"https://api.open-meteo.com/v1/forecast"
             params = {
                 'latitude': lat,
@@ -75,7 +171,7 @@ class LocationAgent:
                 'current_weather': True,
                 'hourly': 'temperature_2m,relative_humidity_2m,precipitation'
             }
-            response = requests.get(url, params=params, timeout=5)
+            response = self.http.get(url, params=params)
             data = response.json()
             current = data['current_weather']
             
@@ -90,15 +186,19 @@ class LocationAgent:
             }
         except Exception as e:
             print(f"Error with free weather: {e}")
-            return {
-                'temperature': 25,
-                'feels_like': 25,
-                'humidity': 60,
-                'description': 'Partly cloudy',
-                'wind_speed': 5,
-                'pressure': 1013,
-                'rain': 0
-            }
+            return None
+    
+    def get_default_weather(self):
+        """Typical conditions used when no weather service answers"""
+        return {
+            'temperature': 25,
+            'feels_like': 25,
+            'humidity': 60,
+            'description': 'Partly cloudy',
+            'wind_speed': 5,
+            'pressure': 1013,
+            'rain': 0
+        }
     
     def weather_code_to_desc(self, code):
         """Convert weather code to description"""
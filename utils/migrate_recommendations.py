@@ -0,0 +1,87 @@
+"""Migrate stored recommendations to the current storage layout.
+
+1. Convert recommendations.detection_id values saved as strings to
+   ObjectId, so they match detections._id and the detection_id index.
+2. With --embed, copy each detection's latest recommendations into the
+   detection document (for EMBED_RECOMMENDATIONS=true).
+
+Safe to re-run; only documents that still need a change are written.
+    python -m utils.migrate_recommendations [--embed] [--dry-run]
+"""
+import argparse
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+
+def flush(collection, operations, dry_run):
+    if operations and not dry_run:
+        collection.bulk_write(operations, ordered=False)
+    count = len(operations)
+    operations.clear()
+    return count
+
+
+def convert_string_ids(db, batch_size, dry_run):
+    operations = []
+    converted = 0
+    for rec in db.recommendations.find({'detection_id': {'$type': 'string'}}, {'detection_id': 1}):
+        if not ObjectId.is_valid(rec['detection_id']):
+            continue
+        operations.append(UpdateOne(
+            {'_id': rec['_id']},
+            {'$set': {'detection_id': ObjectId(rec['detection_id'])}}
+        ))
+        if len(operations) >= batch_size:
+            converted += flush(db.recommendations, operations, dry_run)
+    return converted + flush(db.recommendations, operations, dry_run)
+
+
+def embed_recommendations(db, batch_size, dry_run):
+    """Copy the latest recommendation of every detection into the detection"""
+    pending = db.detections.find({'recommendation': {'$exists': False}}, {'_id': 1})
+    operations = []
+    embedded = 0
+    batch = []
+    for detection in pending:
+        batch.append(detection['_id'])
+        if len(batch) >= batch_size:
+            embedded += embed_batch(db, batch, operations, dry_run)
+            batch = []
+    if batch:
+        embedded += embed_batch(db, batch, operations, dry_run)
+    return embedded
+
+
+def embed_batch(db, detection_ids, operations, dry_run):
+    latest = {}
+    # Ascending by timestamp, so the newest recommendation wins
+    for rec in db.recommendations.find({'detection_id': {'$in': detection_ids}}).sort('timestamp', 1):
+        latest[rec['detection_id']] = rec
+    for detection_id, rec in latest.items():
+        operations.append(UpdateOne({'_id': detection_id}, {'$set': {'recommendation': rec}}))
+    return flush(db.detections, operations, dry_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--embed', action='store_true',
+                        help='Copy recommendations into their detection documents')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='Count changes without writing')
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database()
+
+    converted = convert_string_ids(db, args.batch_size, args.dry_run)
+    print(f"detection_id converted to ObjectId: {converted}")
+    if args.embed:
+        embedded = embed_recommendations(db, args.batch_size, args.dry_run)
+        print(f"Recommendations embedded in detections: {embedded}")
+    if args.dry_run:
+        print("Dry run: nothing was written")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Export the Keras crop models to optimized CPU inference formats.
+
+Writes models/{name}.tflite (run with XNNPACK by the TFLite interpreter)
+and, when tf2onnx is installed, models/{name}.onnx next to each .h5 file.
+Every export is checked against the Keras model: top-1 labels are compared
+through the VisionAgent class_names tables and single-image latency is
+measured for both runtimes. The report is printed and saved as
+models/export_report.json.
+
+Usage:
+    python -m utils.model_export [--formats tflite onnx] [--images DIR]
+
+Serve the exports with VISION_BACKEND=tflite (or onnx).
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from config import Config
+from agents import inference_backends
+from agents.vision_agent import CLASS_NAMES
+from utils.image_pipeline import ImagePreprocessor
+
+
+def model_files():
+    """Keras model files to export, keyed by crop (or model name)"""
+    files = {}
+    for crop in Config.CROPS:
+        files[crop] = os.path.join(Config.MODEL_PATH, f'{crop}_model.h5')
+    files['crop_router'] = os.path.join(Config.MODEL_PATH, Config.CROP_ROUTER_MODEL_FILE)
+    files['multihead'] = os.path.join(Config.MODEL_PATH, Config.MULTIHEAD_MODEL_FILE)
+    return {name: path for name, path in files.items() if os.path.exists(path)}
+
+
+def export_tflite(model, output_path):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, output_path):
+    import tensorflow as tf
+    import tf2onnx
+    # Leave the batch dimension dynamic so batched inference keeps working
+    signature = [tf.TensorSpec((None,) + Config.IMG_SIZE + (3,), tf.float32, name='image')]
+    tf2onnx.convert.from_keras(model, input_signature=signature, output_path=output_path)
+
+
+EXPORTERS = {
+    'tflite': export_tflite,
+    'onnx': export_onnx
+}
+
+
+def load_image_folder(image_folder, limit=None):
+    """Model-ready float32 batch of the images in a folder (unreadable files skipped)"""
+    # Same preprocessing as serving, so parity reflects production inputs
+    preprocessor = ImagePreprocessor(Config.IMG_SIZE)
+    images = []
+    for filename in sorted(os.listdir(image_folder)):
+        if limit and len(images) >= limit:
+            break
+        try:
+            images.append(preprocessor.load(os.path.join(image_folder, filename))[0].copy())
+        except Exception:
+            continue
+    if not images:
+        return np.zeros((0, Config.IMG_SIZE[1], Config.IMG_SIZE[0], 3), dtype=np.float32)
+    return np.stack(images)
+
+
+def sample_inputs(image_folder=None, count=8):
+    """Parity inputs: images from a folder if given, otherwise random noise"""
+    if image_folder:
+        images = load_image_folder(image_folder, count)
+        if len(images):
+            return images
+    return np.random.rand(count, *Config.IMG_SIZE, 3).astype(np.float32)
+
+
+def as_outputs(predictions):
+    return list(predictions) if isinstance(predictions, (list, tuple)) else [predictions]
+
+
+def median_latency_ms(model, inputs, runs=20):
+    """Median single-image predict latency"""
+    single = inputs[:1]
+    model.predict(single, verbose=0)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        model.predict(single, verbose=0)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def parity_report(name, reference, candidate, inputs):
+    """Top-1 agreement and max probability drift between two models"""
+    expected = as_outputs(reference.predict(inputs, verbose=0))
+    actual = as_outputs(candidate.predict(inputs, verbose=0))
+
+    labels = CLASS_NAMES.get(name, Config.CROPS if name == 'crop_router' else None)
+    agreement = []
+    max_diff = 0.0
+    for want, got in zip(expected, actual):
+        want_top = np.argmax(want, axis=-1)
+        got_top = np.argmax(got, axis=-1)
+        agreement.append(float(np.mean(want_top == got_top)))
+        max_diff = max(max_diff, float(np.max(np.abs(want - got))))
+
+    report = {
+        'top1_agreement': min(agreement),
+        'max_abs_diff': max_diff
+    }
+    if labels:
+        report['mismatches'] = [
+            {'expected': labels[e], 'got': labels[g]}
+            for e, g in zip(np.argmax(expected[0], axis=-1), np.argmax(actual[0], axis=-1))
+            if e != g
+        ]
+    return report
+
+
+def export_model(name, keras_path, formats, inputs):
+    import tensorflow as tf
+    model = tf.keras.models.load_model(keras_path)
+    keras_ms = median_latency_ms(model, inputs)
+    report = {'keras_ms': round(keras_ms, 3), 'exports': {}}
+
+    output_names = None
+    if name == 'multihead':
+        heads_path = os.path.splitext(keras_path)[0] + '.json'
+        with open(heads_path) as f:
+            output_names = [f'{crop}_head' for crop in json.load(f)['heads']]
+
+    for fmt in formats:
+        output_path = os.path.splitext(keras_path)[0] + inference_backends.BACKEND_EXTENSIONS[fmt]
+        try:
+            EXPORTERS[fmt](model, output_path)
+            exported = inference_backends.load_model(output_path, Config.INFERENCE_THREADS, output_names)
+        except Exception as e:
+            report['exports'][fmt] = {'error': str(e)}
+            continue
+
+        exported_ms = median_latency_ms(exported, inputs)
+        result = parity_report(name, model, exported, inputs)
+        result.update({
+            'path': output_path,
+            'bytes': os.path.getsize(output_path),
+            'latency_ms': round(exported_ms, 3),
+            'speedup': round(keras_ms / exported_ms, 2) if exported_ms else None
+        })
+        report['exports'][fmt] = result
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--formats', nargs='+', default=['tflite', 'onnx'],
+                        choices=sorted(EXPORTERS))
+    parser.add_argument('--models', nargs='*', default=None,
+                        help='Model names to export (crop names, crop_router, multihead)')
+    parser.add_argument('--images', default=None,
+                        help='Folder of leaf images used for the parity check')
+    args = parser.parse_args()
+
+    inputs = sample_inputs(args.images)
+    files = model_files()
+    if args.models:
+        files = {name: path for name, path in files.items() if name in args.models}
+
+    report = {}
+    for name, path in files.items():
+        report[name] = export_model(name, path, args.formats, inputs)
+        print(f"{name}: keras {report[name]['keras_ms']:.1f} ms")
+        for fmt, result in report[name]['exports'].items():
+            if 'error' in result:
+                print(f"  {fmt}: failed ({result['error']})")
+            else:
+                print(f"  {fmt}: {result['latency_ms']:.1f} ms ({result['speedup']}x), "
+                      f"top-1 agreement {result['top1_agreement']:.1%}, "
+                      f"max diff {result['max_abs_diff']:.2e}")
+
+    report_path = os.path.join(Config.MODEL_PATH, 'export_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Post-training quantization of the crop disease models.
+
+Expects a calibration folder with one sub-folder of leaf images per crop
+(CALIBRATION/tomato/*.jpg, ...). For every crop and variant the images are
+split: the first part is the representative dataset for int8 calibration,
+the rest is the evaluation set. A variant is published as
+models/{crop}_model.{variant}.tflite only if its top-1 agreement with the
+float Keras model on the evaluation set is at least --min-agreement;
+otherwise it is discarded and any previously published file is kept.
+
+Usage:
+    python -m utils.model_quantize CALIBRATION [--variants int8 float16]
+
+Select published variants per crop with MODEL_VARIANTS="tomato:int8,...".
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from config import Config
+from agents import inference_backends
+from utils.model_export import load_image_folder
+
+VARIANTS = inference_backends.QUANTIZED_VARIANTS
+
+
+def convert(model, variant, calibration_images):
+    """TFLite flatbuffer of a Keras model quantized to the given variant"""
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if variant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image[np.newaxis, ...]]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Keep float32 input/output so callers and parity checks are unchanged
+    else:
+        raise ValueError(f'Unknown variant {variant}')
+
+    return converter.convert()
+
+
+def top1_agreement(reference, candidate, images):
+    expected = np.argmax(reference.predict(images, verbose=0), axis=-1)
+    actual = np.argmax(candidate.predict(images, verbose=0), axis=-1)
+    return float(np.mean(expected == actual))
+
+
+def split_images(images, calibration_fraction):
+    """Calibration and evaluation subsets (all images for both if too few)"""
+    split = int(len(images) * calibration_fraction)
+    if split < 1 or split >= len(images):
+        return images, images
+    return images[:split], images[split:]
+
+
+def quantize_crop(crop, images, variants, min_agreement, calibration_fraction):
+    import tensorflow as tf
+    keras_path = os.path.join(Config.MODEL_PATH, f'{crop}_model.h5')
+    model = tf.keras.models.load_model(keras_path)
+    calibration, evaluation = split_images(images, calibration_fraction)
+    float_bytes = os.path.getsize(keras_path)
+
+    report = {}
+    for variant in variants:
+        output_path = inference_backends.variant_path(keras_path, variant)
+        staging_path = output_path + '.tmp'
+        try:
+            with open(staging_path, 'wb') as f:
+                f.write(convert(model, variant, calibration))
+            quantized = inference_backends.TFLiteModel(staging_path, Config.INFERENCE_THREADS)
+            agreement = top1_agreement(model, quantized, evaluation)
+        except Exception as e:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            report[variant] = {'published': False, 'error': str(e)}
+            continue
+
+        result = {
+            'top1_agreement': agreement,
+            'evaluated_images': len(evaluation),
+            'bytes': os.path.getsize(staging_path),
+            'compression': round(float_bytes / os.path.getsize(staging_path), 2)
+        }
+        if agreement >= min_agreement:
+            os.replace(staging_path, output_path)
+            result.update({'published': True, 'path': output_path})
+        else:
+            os.remove(staging_path)
+            result['published'] = False
+        report[variant] = result
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('calibration', help='Folder with one sub-folder of images per crop')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument('--crops', nargs='*', default=None)
+    parser.add_argument('--min-agreement', type=float, default=Config.QUANTIZATION_MIN_AGREEMENT)
+    parser.add_argument('--calibration-fraction', type=float, default=0.5,
+                        help='Share of each crop\'s images used for calibration, the rest for the gate')
+    args = parser.parse_args()
+
+    report = {}
+    for crop in args.crops or Config.CROPS:
+        keras_path = os.path.join(Config.MODEL_PATH, f'{crop}_model.h5')
+        image_folder = os.path.join(args.calibration, crop)
+        if not os.path.exists(keras_path) or not os.path.isdir(image_folder):
+            print(f"Skipping {crop}: model or calibration images missing")
+            continue
+
+        images = load_image_folder(image_folder)
+        if not len(images):
+            print(f"Skipping {crop}: no readable calibration images")
+            continue
+
+        report[crop] = quantize_crop(crop, images, args.variants,
+                                     args.min_agreement, args.calibration_fraction)
+        for variant, result in report[crop].items():
+            if 'error' in result:
+                print(f"{crop} {variant}: failed ({result['error']})")
+            else:
+                status = 'published' if result['published'] else 'REFUSED'
+                print(f"{crop} {variant}: top-1 agreement {result['top1_agreement']:.1%}, "
+                      f"{result['compression']}x smaller, {status}")
+
+    report_path = os.path.join(Config.MODEL_PATH, 'quantization_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Build a shared-backbone multi-head model from the per-crop .h5 files.
+
+The per-crop models are usually fine-tuned copies of the same pretrained
+network. When their leading layers are identical (same config and same
+weights), those layers are kept once as a shared feature extractor and
+every crop keeps only its own remaining layers as a classification head.
+
+Usage:
+    python -m utils.multihead_converter [--crops apple tomato] [--output PATH]
+
+Crops whose backbone was fine-tuned (weights differ from the others) cannot
+be merged losslessly; pass a subset with --crops and VisionAgent will keep
+serving the others from their own .h5 files.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from config import Config
+
+
+def load_crop_models(crops=None):
+    """Load the per-crop Keras models that exist on disk"""
+    models = {}
+    for crop in crops or Config.CROPS:
+        model_path = os.path.join(Config.MODEL_PATH, f'{crop}_model.h5')
+        if os.path.exists(model_path):
+            models[crop] = tf.keras.models.load_model(model_path)
+        else:
+            print(f"Skipping {crop}: {model_path} not found")
+    return models
+
+
+def _model_layers(model):
+    """Layers of a model in call order, without the input layer"""
+    return [layer for layer in model.layers
+            if not isinstance(layer, tf.keras.layers.InputLayer)]
+
+
+def _layer_config(layer):
+    config = dict(layer.get_config())
+    config.pop('name', None)
+    return config
+
+
+def _layers_match(first, other, atol):
+    """True if two layers have the same config and (near) identical weights"""
+    if type(first) is not type(other) or _layer_config(first) != _layer_config(other):
+        return False
+    first_weights, other_weights = first.get_weights(), other.get_weights()
+    if len(first_weights) != len(other_weights):
+        return False
+    return all(
+        a.shape == b.shape and np.allclose(a, b, atol=atol)
+        for a, b in zip(first_weights, other_weights)
+    )
+
+
+def shared_prefix_length(models, atol=1e-6):
+    """Number of leading layers that are identical across all models"""
+    layer_lists = [_model_layers(model) for model in models]
+    # Every head needs at least its final classification layer
+    limit = min(len(layers) for layers in layer_lists) - 1
+
+    prefix = 0
+    while prefix < limit:
+        reference = layer_lists[0][prefix]
+        if not all(_layers_match(reference, layers[prefix], atol) for layers in layer_lists[1:]):
+            break
+        prefix += 1
+    return prefix
+
+
+def _clone_layer(layer, name):
+    """Fresh copy of a layer under a new name (weights are set after build)"""
+    config = layer.get_config()
+    config['name'] = name
+    return layer.__class__.from_config(config)
+
+
+def _apply_layers(tensor, layers, prefix):
+    cloned = []
+    for layer in layers:
+        clone = _clone_layer(layer, f'{prefix}{layer.name}')
+        tensor = clone(tensor)
+        cloned.append((clone, layer))
+    for clone, layer in cloned:
+        clone.set_weights(layer.get_weights())
+    return tensor
+
+
+def build_multihead_model(crop_models, atol=1e-6):
+    """Merge per-crop models into one shared-backbone, multi-output model
+
+    Raises ValueError if the models share no backbone layers or cannot be
+    rebuilt as a plain layer chain.
+    """
+    if not crop_models:
+        raise ValueError('No crop models to convert')
+
+    crops = list(crop_models)
+    models = [crop_models[crop] for crop in crops]
+    prefix = shared_prefix_length(models, atol)
+    if prefix == 0 and len(models) > 1:
+        raise ValueError(
+            'Models share no identical leading layers; their backbones were '
+            'fine-tuned independently and cannot be merged without retraining'
+        )
+
+    inputs = tf.keras.Input(shape=Config.IMG_SIZE + (3,), name='image')
+    features = _apply_layers(inputs, _model_layers(models[0])[:prefix], 'backbone_')
+
+    outputs = []
+    for crop, model in zip(crops, models):
+        head_layers = _model_layers(model)[prefix:]
+        x = _apply_layers(features, head_layers[:-1], f'{crop}_')
+        last = head_layers[-1]
+        head = _clone_layer(last, f'{crop}_head')
+        outputs.append(head(x))
+        head.set_weights(last.get_weights())
+
+    multihead = tf.keras.Model(inputs, outputs, name='multihead_crop_classifier')
+    check_parity(multihead, crop_models)
+    return multihead, prefix
+
+
+def check_parity(multihead, crop_models, samples=4, atol=1e-4):
+    """Compare multi-head outputs with the original models on random input"""
+    batch = np.random.rand(samples, *Config.IMG_SIZE, 3).astype(np.float32)
+    outputs = multihead.predict(batch, verbose=0)
+    if not isinstance(outputs, (list, tuple)):
+        outputs = [outputs]
+
+    for (crop, model), merged in zip(crop_models.items(), outputs):
+        original = model.predict(batch, verbose=0)
+        if original.shape != merged.shape or not np.allclose(original, merged, atol=atol):
+            raise ValueError(
+                f'{crop}: merged head does not reproduce the original model '
+                '(only sequential layer chains are supported)'
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--crops', nargs='*', default=None,
+                        help='Crops to merge (default: all in Config.CROPS)')
+    parser.add_argument('--output', default=os.path.join(Config.MODEL_PATH, Config.MULTIHEAD_MODEL_FILE))
+    parser.add_argument('--atol', type=float, default=1e-6,
+                        help='Tolerance when comparing backbone weights')
+    args = parser.parse_args()
+
+    crop_models = load_crop_models(args.crops)
+    try:
+        multihead, prefix = build_multihead_model(crop_models, args.atol)
+    except ValueError as e:
+        raise SystemExit(f"Conversion failed: {e}")
+
+    multihead.save(args.output)
+    # VisionAgent reads the head order without loading the model
+    heads_path = os.path.splitext(args.output)[0] + '.json'
+    with open(heads_path, 'w') as f:
+        json.dump({'heads': list(crop_models)}, f)
+
+    total = sum(model.count_params() for model in crop_models.values())
+    print(f"Shared backbone: {prefix} layers")
+    print(f"Heads: {', '.join(crop_models)}")
+    print(f"Parameters: {total:,} -> {multihead.count_params():,}")
+    print(f"Saved multi-head model to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""Regional disease-outbreak analytics over stored detections.
+
+Every detection with coordinates increments one counter document per
+(geohash cell, day, crop, disease) in outbreak_counts; the document also
+carries the cell centre as a GeoJSON point under a (location 2dsphere, day)
+index, so "what is going around near here" sums a few hundred small
+documents instead of scanning detections.
+
+Detections are queued by save_detection and counted by a background
+thread, so none of this runs on the request thread. Detections without a
+real location (LocationAgent's fallback) are skipped; they would all land
+in one cell and look like an outbreak.
+
+After each increment only that cell/crop/disease is re-evaluated: the count
+of the current window (the last `window_days` days) is compared with the
+previous `baseline_windows` windows, and a spike with a z-score of at least
+`z_threshold` (and at least `min_count` detections) is written to
+outbreak_alerts. Alerts expire on their own a window after the last spike.
+
+Backfill counters from existing detections:
+    python -m utils.outbreaks --rebuild
+"""
+import argparse
+import math
+import queue
+import threading
+from datetime import datetime, timedelta
+import logging
+
+from pymongo import UpdateOne
+
+from utils import geohash
+from utils.location import DEFAULT_COORDINATES, is_default_location
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6378.1
+
+
+def day_of(timestamp):
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+
+class OutbreakTracker:
+    def __init__(self, counts, alerts, precision=5, window_days=7, baseline_windows=4,
+                 z_threshold=3.0, min_count=5, retention_days=365, max_pending=1024):
+        self.counts = counts
+        self.alerts = alerts
+        self.precision = precision
+        self.window_days = window_days
+        self.baseline_windows = baseline_windows
+        self.z_threshold = z_threshold
+        self.min_count = min_count
+        self.retention_days = retention_days
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.recorded = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self.alerts_raised = 0
+        try:
+            self.create_count_indexes(self.counts)
+            self.alerts.create_index([('location', '2dsphere')])
+            self.alerts.create_index('expires_at', expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"Could not create outbreak indexes: {str(e)}")
+        worker = threading.Thread(target=self._worker, name='outbreak-tracker', daemon=True)
+        worker.start()
+
+    def create_count_indexes(self, counts):
+        counts.create_index([('location', '2dsphere'), ('day', 1)])
+        counts.create_index([('cell', 1), ('crop', 1), ('disease', 1), ('day', -1)])
+        counts.create_index('expires_at', expireAfterSeconds=0)
+
+    def cell_of(self, lat, lon):
+        return geohash.encode(lat, lon, self.precision)
+
+    def counter_update(self, cell, day, crop, disease, count=1):
+        lat, lon = geohash.decode(cell)
+        return UpdateOne(
+            {'_id': f'{cell}|{day:%Y-%m-%d}|{crop}|{disease}'},
+            {
+                '$inc': {'count': count},
+                '$setOnInsert': {
+                    'cell': cell,
+                    'day': day,
+                    'crop': crop,
+                    'disease': disease,
+                    'location': {'type': 'Point', 'coordinates': [lon, lat]},
+                    'expires_at': day + timedelta(days=self.retention_days)
+                }
+            },
+            upsert=True
+        )
+
+    def record(self, detection):
+        """Queue a new detection for counting; never blocks the caller"""
+        location = detection.get('location') or {}
+        if location.get('lat') is None or location.get('lon') is None or is_default_location(location):
+            self.skipped += 1
+            return
+        try:
+            self.pending.put_nowait(detection)
+        except queue.Full:
+            # Analytics are best-effort; never hold up a request for them
+            self.dropped += 1
+            logger.warning("Outbreak queue full, detection not counted")
+
+    def _worker(self):
+        while True:
+            detection = self.pending.get()
+            try:
+                if self.process(detection):
+                    self.alerts_raised += 1
+                self.recorded += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Outbreak tracking failed: {str(e)}")
+
+    def process(self, detection):
+        """Count a detection in its cell and day, then re-check that cell for a spike"""
+        location = detection['location']
+        cell = self.cell_of(location['lat'], location['lon'])
+        self.counts.bulk_write([self.counter_update(
+            cell, day_of(detection['timestamp']), detection['crop_type'], detection['disease']
+        )])
+        return self.evaluate(cell, detection['crop_type'], detection['disease'], detection['timestamp'])
+
+    def window_counts(self, cell, crop, disease, now):
+        """Detections per window, newest first: [current, previous, ...]"""
+        today = day_of(now)
+        windows = [0] * (self.baseline_windows + 1)
+        since = today - timedelta(days=self.window_days * len(windows) - 1)
+        for doc in self.counts.find(
+            {'cell': cell, 'crop': crop, 'disease': disease, 'day': {'$gte': since}},
+            {'day': 1, 'count': 1}
+        ):
+            windows[(today - doc['day']).days // self.window_days] += doc['count']
+        return windows
+
+    def evaluate(self, cell, crop, disease, now=None):
+        """Flag the cell/crop/disease if its current window is a spike; returns the alert or None"""
+        if 'Healthy' in disease:
+            return None
+        now = now or datetime.utcnow()
+        current, *baseline = self.window_counts(cell, crop, disease, now)
+        mean = sum(baseline) / len(baseline)
+        variance = sum((count - mean) ** 2 for count in baseline) / len(baseline)
+        # Poisson floor: a quiet baseline must not turn every second case into a spike
+        z_score = (current - mean) / math.sqrt(max(variance, mean, 1.0))
+        if current < self.min_count or z_score < self.z_threshold:
+            return None
+
+        lat, lon = geohash.decode(cell)
+        alert = {
+            'cell': cell,
+            'crop': crop,
+            'disease': disease,
+            'count': current,
+            'baseline_mean': round(mean, 2),
+            'z_score': round(z_score, 2),
+            'window_days': self.window_days,
+            'location': {'type': 'Point', 'coordinates': [lon, lat]},
+            'updated_at': now,
+            'expires_at': now + timedelta(days=self.window_days)
+        }
+        self.alerts.update_one(
+            {'_id': f'{cell}|{crop}|{disease}'},
+            {'$set': alert, '$setOnInsert': {'first_seen': now}},
+            upsert=True
+        )
+        return alert
+
+    def near(self, lat, lon, radius_km):
+        return {'$geoWithin': {'$centerSphere': [[lon, lat], radius_km / EARTH_RADIUS_KM]}}
+
+    def top_diseases_near(self, lat, lon, radius_km=25, days=7, limit=10, include_healthy=False):
+        """Most detected crop/disease pairs within radius_km over the last `days` days"""
+        query = {
+            'location': self.near(lat, lon, radius_km),
+            'day': {'$gte': day_of(datetime.utcnow()) - timedelta(days=days - 1)}
+        }
+        if not include_healthy:
+            query['disease'] = {'$ne': 'Healthy'}
+        results = self.counts.aggregate([
+            {'$match': query},
+            {'$group': {
+                '_id': {'crop': '$crop', 'disease': '$disease'},
+                'count': {'$sum': '$count'},
+                'cells': {'$addToSet': '$cell'}
+            }},
+            {'$sort': {'count': -1}},
+            {'$limit': limit}
+        ])
+        return [
+            {
+                'crop': item['_id']['crop'],
+                'disease': item['_id']['disease'],
+                'count': item['count'],
+                'cells': len(item['cells'])
+            }
+            for item in results
+        ]
+
+    def alerts_near(self, lat, lon, radius_km=50):
+        """Active outbreak alerts within radius_km, strongest first"""
+        return list(self.alerts.find(
+            {'location': self.near(lat, lon, radius_km), 'expires_at': {'$gt': datetime.utcnow()}},
+            {'_id': 0, 'location': 0, 'expires_at': 0}
+        ).sort('z_score', -1))
+
+    def stats(self):
+        return {
+            'pending': self.pending.qsize(),
+            'recorded': self.recorded,
+            'skipped': self.skipped,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'alerts_raised': self.alerts_raised
+        }
+
+    def count_detections(self, detections, counts, timestamp, batch_size=1000):
+        """Add located detections with a timestamp in the given range to `counts`"""
+        totals = {}
+        for doc in detections.find(
+            {
+                'timestamp': timestamp,
+                'location.lat': {'$ne': None},
+                'location.lon': {'$ne': None},
+                'location.is_default': {'$ne': True},
+                # Fallback locations stored before they were flagged
+                '$nor': [{'location.lat': DEFAULT_COORDINATES[0], 'location.lon': DEFAULT_COORDINATES[1]}]
+            },
+            {'location.lat': 1, 'location.lon': 1, 'crop_type': 1, 'disease': 1, 'timestamp': 1},
+            batch_size=batch_size
+        ):
+            key = (
+                self.cell_of(doc['location']['lat'], doc['location']['lon']),
+                day_of(doc['timestamp']), doc['crop_type'], doc['disease']
+            )
+            totals[key] = totals.get(key, 0) + 1
+
+        operations = []
+        for (cell, day, crop, disease), count in totals.items():
+            operations.append(self.counter_update(cell, day, crop, disease, count))
+            if len(operations) >= batch_size:
+                counts.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            counts.bulk_write(operations, ordered=False)
+        return len(totals)
+
+    def rebuild(self, detections, batch_size=1000):
+        """Recount every cell from raw detections (replaces the current counters)
+
+        Counters are built into a scratch collection and swapped in with a
+        rename, so queries never see them half-built. Detections counted by
+        the worker during the rebuild went to the replaced collection and
+        are added again after the swap.
+        """
+        started = datetime.utcnow()
+        scratch = self.counts.database[f'{self.counts.name}_rebuild']
+        scratch.drop()
+        # Creating the indexes also creates the collection, so the rename works with no detections
+        self.create_count_indexes(scratch)
+        cells = self.count_detections(detections, scratch, {'$lt': started}, batch_size)
+        swapped = datetime.utcnow()
+        scratch.rename(self.counts.name, dropTarget=True)
+        self.count_detections(detections, self.counts, {'$gte': started, '$lt': swapped}, batch_size)
+        return cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rebuild', action='store_true', help='Recount all cells from detections')
+    parser.add_argument('--near', nargs=2, type=float, metavar=('LAT', 'LON'),
+                        help='Print the top diseases and alerts near a coordinate')
+    parser.add_argument('--radius-km', type=float, default=25)
+    parser.add_argument('--days', type=int, default=7)
+    args = parser.parse_args()
+
+    from database import Database
+    db = Database()
+    if args.rebuild:
+        print(f"Rebuilt {db.outbreaks.rebuild(db.detections)} outbreak counters")
+    if args.near:
+        lat, lon = args.near
+        for item in db.outbreaks.top_diseases_near(lat, lon, args.radius_km, args.days):
+            print(f"{item['crop']}/{item['disease']}: {item['count']} in {item['cells']} cells")
+        for alert in db.outbreaks.alerts_near(lat, lon, args.radius_km):
+            print(f"ALERT {alert['crop']}/{alert['disease']} in {alert['cell']}: "
+                  f"{alert['count']} vs {alert['baseline_mean']} (z={alert['z_score']})")
+
+
+if __name__ == '__main__':
+    main()
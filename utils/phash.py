@@ -0,0 +1,54 @@
+import io
+from PIL import Image
+
+HASH_BITS = 64
+# Stored hashes are split into 8-bit chunks for multi-index lookup. By the
+# pigeonhole principle two hashes within Hamming distance 7 share at least
+# one identical chunk, so an exact index on the chunks finds every
+# candidate without scanning.
+CHUNK_BITS = 8
+CHUNK_COUNT = HASH_BITS // CHUNK_BITS
+MAX_INDEXED_DISTANCE = CHUNK_COUNT - 1
+
+
+def dhash(source, hash_size=8):
+    """64-bit difference hash of an image path, bytes or file object
+
+    Robust to resizing and recompression (e.g. WhatsApp forwarding): each
+    bit says whether a pixel is brighter than its right neighbour in a
+    9x8 grayscale thumbnail.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    img.draft('L', (hash_size * 8, hash_size * 8))
+    img = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(img.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(first, second):
+    return bin(first ^ second).count('1')
+
+
+def to_hex(value):
+    return f'{value:016x}'
+
+
+def from_hex(text):
+    return int(text, 16)
+
+
+def chunk_keys(value):
+    """Index keys of a hash, one per chunk, tagged with the chunk position"""
+    mask = (1 << CHUNK_BITS) - 1
+    return [
+        f'{position}:{(value >> (position * CHUNK_BITS)) & mask:02x}'
+        for position in range(CHUNK_COUNT)
+    ]
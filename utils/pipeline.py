@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StagePipeline:
+    """Run the stages of one request concurrently with timings and fallbacks
+
+    Stages submitted to the shared executor run in parallel; wait() gives
+    each one a deadline measured from the start of the request and returns
+    a fallback value if the stage fails or misses it.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.fallbacks = []
+
+    def _timed(self, name, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def run(self, name, func, *args, **kwargs):
+        """Run a stage on the calling thread"""
+        return self._timed(name, func, *args, **kwargs)
+
+    def submit(self, name, func, *args, executor=None, **kwargs):
+        """Start a stage in the background (on `executor` instead of the shared one if given)"""
+        return (executor or self.executor).submit(self._timed, name, func, *args, **kwargs)
+
+    def then(self, name, future, func):
+        """Start stage func(result) once `future` has finished
+
+        Chained with a done-callback, so no pool thread is held while the
+        first stage is still queued or running in the same pool.
+        """
+        chained = Future()
+
+        def forward(done):
+            try:
+                chained.set_result(done.result())
+            except Exception as e:
+                chained.set_exception(e)
+
+        def start(done):
+            try:
+                self.submit(name, func, done.result()).add_done_callback(forward)
+            except Exception as e:
+                chained.set_exception(e)
+
+        future.add_done_callback(start)
+        return chained
+
+    def wait(self, name, future, deadline, fallback):
+        """Result of a stage, or fallback() after `deadline` seconds from the start"""
+        remaining = self.started + deadline - time.perf_counter()
+        try:
+            return future.result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            logger.warning(f"Stage {name} missed its {deadline}s deadline, using fallback")
+        except Exception as e:
+            logger.error(f"Stage {name} failed: {str(e)}")
+        if name not in self.fallbacks:
+            self.fallbacks.append(name)
+        return fallback()
+
+    def elapsed(self):
+        """Seconds since the request started"""
+        return time.perf_counter() - self.started
+
+    def report(self):
+        return {
+            'stages_ms': dict(self.timings),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'fallbacks': list(self.fallbacks)
+        }
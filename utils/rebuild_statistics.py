@@ -0,0 +1,65 @@
+"""Rebuild the statistics rollups from the raw detections.
+
+save_detection keeps the rollups current with $inc; run this after
+importing or deleting detections directly, or to repair drift. Counts are
+built into a scratch collection and swapped in with a rename, so readers
+never see a half-built state. Detections saved while the rebuild runs are
+counted again after the swap (their $inc went to the replaced collection);
+only one saved in the instant of the swap itself can be counted twice.
+    python -m utils.rebuild_statistics
+"""
+import argparse
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from database import Database, rollup_counters
+
+
+def rebuild(db, batch_size=1000):
+    started = datetime.utcnow()
+    rollups = rollup_counters(db.detections, {'timestamp': {'$lt': started}})
+
+    scratch = db.db[f'{db.statistics.name}_rebuild']
+    scratch.drop()
+    operations = []
+    for scope, increments in rollups.items():
+        operations.append(UpdateOne(
+            {'_id': scope},
+            {'$inc': dict(increments), '$set': {'complete': True}},
+            upsert=True
+        ))
+        if len(operations) >= batch_size:
+            scratch.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        scratch.bulk_write(operations, ordered=False)
+
+    swapped = datetime.utcnow()
+    if rollups:
+        scratch.rename(db.statistics.name, dropTarget=True)
+    else:
+        db.statistics.drop()
+
+    # Detections saved during the rebuild were counted in the replaced collection
+    for detection in db.detections.find(
+        {'timestamp': {'$gte': started, '$lt': swapped}},
+        {'user_id': 1, 'crop_type': 1, 'disease': 1, 'location.region': 1, 'timestamp': 1},
+        batch_size=batch_size
+    ):
+        db.update_statistics(detection)
+    return len(rollups)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    db = Database()
+    documents = rebuild(db, args.batch_size)
+    print(f"Rebuilt {documents} statistics documents")
+
+
+if __name__ == '__main__':
+    main()
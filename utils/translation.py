@@ -3,11 +3,17 @@ from gtts import gTTS
 from googletrans import Translator
 import io
 import logging
+from utils.documents import collect_strings, replace_strings
 
 logger = logging.getLogger(__name__)
 
 class TranslationHelper:
-    def __init__(self):
+    def __init__(self, backend=None, memory=None):
+        """backend: optional bulk translator with translate_texts(texts, target),
+        e.g. DecisionAgent, used instead of googletrans.
+        memory: optional TranslationMemory consulted before any external call"""
+        self.backend = backend
+        self.memory = memory
         self.translator = Translator()
         self.recognizer = sr.Recognizer()
         
@@ -75,12 +81,56 @@ class TranslationHelper:
         """
         Translate text between languages
         """
+        if self.backend is not None:
+            return self.translate_batch([text], source, target)[0]
+        if self.memory is not None:
+            remembered = self.memory.get(text, target)
+            if remembered is not None:
+                return remembered
         try:
             translation = self.translator.translate(text, src=source, dest=target)
-            return translation.text
         except Exception as e:
             logger.error(f"Translation failed: {str(e)}")
             return text  # Return original text if translation fails
+        if self.memory is not None:
+            self.memory.put(text, target, translation.text)
+        return translation.text
+    
+    def translate_batch(self, texts, source='auto', target='en'):
+        """
+        Translate a list of strings in as few calls as possible
+        """
+        texts = list(texts)
+        if not texts:
+            return texts
+        
+        known = {}
+        if self.memory is not None:
+            known = self.memory.lookup(texts, target)
+        missing = [text for text in dict.fromkeys(texts) if text not in known]
+        
+        if missing:
+            try:
+                if self.backend is not None:
+                    translated = self.backend.translate_texts(missing, target)
+                else:
+                    translated = [t.text for t in self.translator.translate(missing, src=source, dest=target)]
+            except Exception as e:
+                logger.error(f"Batch translation failed: {str(e)}")
+                translated = missing
+            new = {text: translation for text, translation in zip(missing, translated) if translation != text}
+            if self.memory is not None:
+                self.memory.store(new, target)
+            known.update(new)
+        
+        return [known.get(text, text) for text in texts]
+    
+    def translate_document(self, document, source='auto', target='en'):
+        """
+        Translate every leaf string of a nested dict/list, keeping its shape
+        """
+        translated = self.translate_batch(collect_strings(document), source, target)
+        return replace_strings(document, iter(translated))
     
     def detect_language(self, text):
         """
@@ -0,0 +1,149 @@
+"""Persistent phrase-level translation memory.
+
+Recommendation text is mostly drawn from a small set of recurring phrases,
+so translations are stored per (normalized source text, target language)
+in MongoDB with an in-process LRU in front, and consulted before any
+external translation call.
+
+Pre-warm every supported language with the fallback recommendation
+phrases:
+    python -m utils.translation_memory --prewarm
+"""
+import argparse
+import hashlib
+from datetime import datetime
+import logging
+
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """Key form of a phrase: collapsed whitespace, case-folded"""
+    return ' '.join(text.split()).casefold()
+
+
+class TranslationMemory:
+    def __init__(self, collection=None, maxsize=20000):
+        self.collection = collection
+        self.local = LRUCache(maxsize)
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.stored = 0
+
+    def key(self, text, language):
+        digest = hashlib.sha1(normalize(text).encode('utf-8')).hexdigest()
+        return f'{language}:{digest}'
+
+    def lookup(self, texts, language):
+        """Known translations for the given texts, as {text: translation}"""
+        found = {}
+        missing = {}
+        for text in dict.fromkeys(texts):
+            key = self.key(text, language)
+            translation = self.local.get(key)
+            if translation is not None:
+                found[text] = translation
+            else:
+                # Texts differing only in whitespace or case share a key
+                missing.setdefault(key, []).append(text)
+
+        if missing and self.collection is not None:
+            try:
+                for doc in self.collection.find({'_id': {'$in': list(missing)}}, {'translation': 1}):
+                    for text in missing.pop(doc['_id']):
+                        found[text] = doc['translation']
+                    self.local.set(doc['_id'], doc['translation'])
+                    self.shared_hits += 1
+            except Exception as e:
+                logger.error(f"Translation memory lookup failed: {str(e)}")
+            self.shared_misses += len(missing)
+        return found
+
+    def get(self, text, language):
+        return self.lookup([text], language).get(text)
+
+    def store(self, translations, language):
+        """Remember {source text: translation} pairs"""
+        if not translations:
+            return
+        from pymongo import UpdateOne
+        operations = []
+        for text, translation in translations.items():
+            key = self.key(text, language)
+            self.local.set(key, translation)
+            operations.append(UpdateOne(
+                {'_id': key},
+                {'$set': {
+                    'source': normalize(text),
+                    'language': language,
+                    'translation': translation,
+                    'updated_at': datetime.utcnow()
+                }},
+                upsert=True
+            ))
+        self.stored += len(operations)
+        if self.collection is not None:
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                logger.error(f"Translation memory write failed: {str(e)}")
+
+    def put(self, text, language, translation):
+        self.store({text: translation}, language)
+
+    def stats(self):
+        shared_lookups = self.shared_hits + self.shared_misses
+        return {
+            'local': self.local.stats(),
+            'shared': {
+                'hits': self.shared_hits,
+                'misses': self.shared_misses,
+                'hit_rate': round(self.shared_hits / shared_lookups, 4) if shared_lookups else 0.0
+            },
+            'stored': self.stored
+        }
+
+
+def prewarm_phrases(decision_agent):
+    """Every phrase of the fallback recommendations, for all crops and diseases"""
+    from agents.vision_agent import CLASS_NAMES
+    from utils.documents import collect_strings
+
+    phrases = []
+    for crop, diseases in CLASS_NAMES.items():
+        for disease in diseases:
+            fallback = decision_agent.get_fallback_recommendations(crop, disease, 'Healthy' in disease)
+            phrases.extend(collect_strings(fallback))
+    return list(dict.fromkeys(phrases))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--prewarm', action='store_true',
+                        help='Translate the fallback phrases into every supported language')
+    parser.add_argument('--languages', nargs='*', default=None)
+    args = parser.parse_args()
+
+    from config import Config
+    from database import Database
+    from agents.decision_agent import DecisionAgent
+
+    db = Database()
+    memory = TranslationMemory(db.translation_memory)
+    if not args.prewarm:
+        print(f"{db.translation_memory.count_documents({})} stored translations")
+        return
+
+    decision_agent = DecisionAgent(translation_memory=memory)
+    phrases = prewarm_phrases(decision_agent)
+    for language in args.languages or Config.LANGUAGES:
+        if language == 'en':
+            continue
+        decision_agent.translate_texts(phrases, language)
+        print(f"{language}: {len(memory.lookup(phrases, language))}/{len(phrases)} phrases in memory")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import os
+import queue
+import hashlib
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data):
+    """SHA-256 hex digest of an upload's bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadStore:
+    """Content-addressed upload storage written by a background thread
+
+    Files are named by the SHA-256 of their bytes (uploads/ab/abcd....jpg),
+    so a photo uploaded many times is stored once. save() returns the final
+    path immediately (or None if the upload will not be persisted); the
+    write happens off the request thread.
+    """
+
+    def __init__(self, folder, max_pending=256):
+        self.folder = folder
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.failed = 0
+        worker = threading.Thread(target=self._worker, name='upload-writer', daemon=True)
+        worker.start()
+
+    def path_for(self, digest, filename):
+        extension = os.path.splitext(filename)[1].lower() or '.jpg'
+        return os.path.join(self.folder, digest[:2], digest + extension)
+
+    def save(self, data, filename, digest=None):
+        """Queue an upload for writing and return the path it will have, or None if dropped"""
+        digest = digest or content_hash(data)
+        path = self.path_for(digest, filename)
+        # No stat here: the upload volume may be remote; the writer skips existing files
+        try:
+            self.pending.put_nowait((path, data))
+        except queue.Full:
+            # Persisting is best-effort; never block a request on the disk
+            self.dropped += 1
+            logger.warning(f"Upload queue full, not persisting {path}")
+            return None
+        return path
+
+    def _worker(self):
+        while True:
+            path, data = self.pending.get()
+            temp_path = None
+            try:
+                if os.path.exists(path):
+                    self.duplicates += 1
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Unique per process and thread: workers may store the same image at once
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to persist upload {path}: {str(e)}")
+                if temp_path is not None and os.path.exists(temp_path):
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        return {
+            'pending': self.pending.qsize(),
+            'written': self.written,
+            'duplicates': self.duplicates,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }